@@ -1,14 +1,179 @@
 # DataPrep.py
-import yfinance as yf
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import os
 import time
 import random
+from profiling import instrumented
 
+# yfinance is imported when a loader is created, so the metric derivation
+# below can be used (and benchmarked) without it
+
+DATA_PATH = 'output/btc_raw_data.csv'
+
+# Set to 1 to load market data in compact mode (see load_market_data)
+COMPACT_ENV = 'BTC_RISK_COMPACT'
+
+# Column dtypes in compact mode. Close stays float64 because returns and
+# every indicator are derived from it: float32 spacing at 100k USD is ~0.8
+# cents, which swamps second-level returns. Other columns are used as-is.
+COMPACT_DTYPES = {
+    'Open': np.float32, 'High': np.float32, 'Low': np.float32, 'Close': np.float64,
+    'Volume': np.float32, 'Returns': np.float32, 'Log_Returns': np.float32,
+}
+
+def is_compact():
+    """Whether compact loading is switched on through BTC_RISK_COMPACT"""
+    return os.environ.get(COMPACT_ENV, '').lower() in ('1', 'true', 'yes')
+
+def _compact_store(path):
+    """
+    Columnar copy of a data CSV (<name>.compact.npz next to it)
+
+    Dates are stored as int64 epoch microseconds and the columns of
+    COMPACT_DTYPES in their compact dtypes; Dividends, Stock Splits and the
+    derived columns that readers recompute are left out. The store is
+    rebuilt when the CSV's size or modification time changes.
+    """
+    store_path = os.path.splitext(path)[0] + '.compact.npz'
+    stat = os.stat(path)
+    source = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    if os.path.exists(store_path):
+        store = np.load(store_path)
+        if np.array_equal(store['_source'], source):
+            return store
+    header = pd.read_csv(path, nrows=0).columns
+    columns = [c for c in COMPACT_DTYPES if c in header]
+    df = pd.read_csv(path, usecols=['Date', *columns], index_col='Date', parse_dates=True, dtype=COMPACT_DTYPES)
+    arrays = {c: df[c].to_numpy() for c in columns}
+    # Naive dates are taken as UTC
+    dates = df.index.tz_convert(None) if df.index.tz is not None else df.index
+    arrays['Date'] = dates.as_unit('us').asi8
+    # Written under a temporary name so concurrent readers never see a partial file
+    tmp_path = f"{store_path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, _source=source, **arrays)
+    os.replace(tmp_path, store_path)
+    return np.load(store_path)
+
+def load_market_data(path=DATA_PATH, columns=None, compact=None):
+    """
+    Read stored bars as a UTC Date-indexed DataFrame
+
+    Args:
+        path (str): CSV written by BitcoinDataLoader (or market_simulator)
+        columns (list): Columns to keep (default: all)
+        compact (bool): Read the compact store instead of parsing the CSV:
+            float32 columns except Close and integer epoch dates. Defaults to
+            the BTC_RISK_COMPACT environment variable.
+
+    Returns:
+        pd.DataFrame: the bars
+    """
+    if compact is None:
+        compact = is_compact()
+    if not compact:
+        usecols = None if columns is None else ['Date', *columns]
+        df = pd.read_csv(path, usecols=usecols, index_col='Date', parse_dates=True)
+        # Dates without an offset are taken as UTC
+        df.index = pd.to_datetime(df.index, utc=True)
+        return df
+    store = _compact_store(path)
+    if columns is None:
+        columns = [c for c in store.files if c not in ('Date', '_source')]
+    missing = [c for c in columns if c not in store.files]
+    if missing:
+        raise KeyError(f"Columns not in the compact store: {', '.join(missing)}")
+    index = pd.DatetimeIndex(store['Date'].astype('datetime64[us]'), name='Date').tz_localize('UTC')
+    return pd.DataFrame({c: store[c] for c in columns}, index=index)
+
+def _max_deviation(reference, compact):
+    """Largest absolute and relative (to the reference's scale) difference"""
+    reference = np.asarray(reference, dtype=np.float64)
+    compact = np.asarray(compact, dtype=np.float64)
+    mask = np.isfinite(reference) & np.isfinite(compact)
+    if not mask.any():
+        return 0.0, 0.0
+    diff = np.abs(reference[mask] - compact[mask]).max()
+    scale = np.abs(reference[mask]).max()
+    return float(diff), float(diff / scale) if scale else 0.0
+
+def validate_compact(path=DATA_PATH, report_path='output/compact_validation.txt'):
+    """
+    Compare compact loading with the float64 CSV and write a report
+
+    Covers the stored columns, the model features and the lending
+    analysis computed from both loads, and the memory of each frame.
+
+    Returns:
+        dict: name -> (max absolute, max relative deviation), plus memory in bytes
+    """
+    import contextlib
+    import io
+    from RiskMLModel import BitcoinRiskModel
+    from RiskAnalysis import LendingRiskAnalyzer
+
+    full = load_market_data(path, compact=False)
+    compact = load_market_data(path, compact=True)
+    results = {'memory': {'float64': int(full.memory_usage(deep=True).sum()),
+                          'float64_same_columns': int(full[compact.columns].memory_usage(deep=True).sum()),
+                          'compact': int(compact.memory_usage(deep=True).sum())}}
+    deviations = {}
+    for column in compact.columns:
+        deviations[f"column {column}"] = _max_deviation(full[column], compact[column])
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        features = [BitcoinRiskModel(data=df[['Close', 'Volume']]).create_features() for df in (full, compact)]
+        analyses = [LendingRiskAnalyzer(data=df[['Close', 'Returns']]).analyze_liquidation_parameters()
+                    for df in (full, compact)]
+    for column in features[0].columns:
+        if pd.api.types.is_numeric_dtype(features[0][column]):
+            deviations[f"feature {column}"] = _max_deviation(features[0][column], features[1][column])
+    for key, value in analyses[0].items():
+        if isinstance(value, (int, float)):
+            deviations[f"liquidation {key}"] = _max_deviation([value], [analyses[1][key]])
+    results['deviations'] = deviations
+
+    os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+    worst = max(deviations, key=lambda name: deviations[name][1])
+    with open(report_path, 'w') as f:
+        f.write("Compact Loading Validation\n")
+        f.write(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write("=" * 50 + "\n\n")
+        f.write(f"Rows: {len(full):,}\n")
+        f.write(f"Memory (float64, all columns): {results['memory']['float64'] / 2**20:,.2f} MB\n")
+        f.write(f"Memory (float64, compact columns): {results['memory']['float64_same_columns'] / 2**20:,.2f} MB\n")
+        f.write(f"Memory (compact): {results['memory']['compact'] / 2**20:,.2f} MB\n")
+        f.write(f"Largest relative deviation: {deviations[worst][1]:.3e} ({worst})\n\n")
+        f.write(f"{'value':40s} {'max abs':>12s} {'max rel':>12s}\n")
+        for name, (absolute, relative) in deviations.items():
+            f.write(f"{name:40s} {absolute:12.3e} {relative:12.3e}\n")
+    print(f"Compact loading validation saved to {report_path}")
+    return results
+
+def derive_metrics(df):
+    """
+    Add return, volatility, drawdown and volume metrics to OHLCV bars
+
+    Args:
+        df (pd.DataFrame): Bars with Close and Volume columns (modified in place)
+
+    Returns:
+        pd.DataFrame: df with the derived columns
+    """
+    df['Returns'] = df['Close'].pct_change()
+    df['Log_Returns'] = np.log(df['Close'] / df['Close'].shift(1))
+    df['Volatility'] = df['Returns'].rolling(window=30).std() * np.sqrt(252)  #Corrected 252
+    df['Rolling_Max'] = df['Close'].expanding().max()
+    df['Drawdown'] = (df['Close'] - df['Rolling_Max']) / df['Rolling_Max']
+    df['Volume_MA'] = df['Volume'].rolling(window=30).mean()
+    df['Volume_Ratio'] = df['Volume'] / df['Volume_MA']
+    return df
+
+@instrumented
 class BitcoinDataLoader:
     def __init__(self, symbol="BTC-USD"):
+        import yfinance as yf
         self.symbol = symbol
         self.data = None
         self.ticker = yf.Ticker(symbol)
@@ -27,6 +192,7 @@ class BitcoinDataLoader:
         Returns:
             pd.DataFrame: The fetched data, or None if all retries fail.
         """
+        import yfinance as yf
         for attempt in range(retries):
             try:
                 df = self.ticker.history(period=period, interval=interval)
@@ -36,13 +202,7 @@ class BitcoinDataLoader:
                     return None
 
                 # Calculate metrics
-                df['Returns'] = df['Close'].pct_change()
-                df['Log_Returns'] = np.log(df['Close'] / df['Close'].shift(1))
-                df['Volatility'] = df['Returns'].rolling(window=30).std() * np.sqrt(252)  #Corrected 252
-                df['Rolling_Max'] = df['Close'].expanding().max()
-                df['Drawdown'] = (df['Close'] - df['Rolling_Max']) / df['Rolling_Max']
-                df['Volume_MA'] = df['Volume'].rolling(window=30).mean()
-                df['Volume_Ratio'] = df['Volume'] / df['Volume_MA']
+                derive_metrics(df)
 
                 self.data = df
                 return df
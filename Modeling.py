@@ -1,16 +1,18 @@
 import pandas as pd
 import numpy as np
-from scipy.stats import norm
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
-import requests
-import json
+from profiling import instrumented
 
+# Column of the BTC history in the multi-asset return panel
+BTC_ASSET = 'BTC-USD'
+
+@instrumented
 class CryptoRiskManagementModel:
     def __init__(self, lookback_years=7, confidence_level=0.99,
                  max_drawdown_threshold=-0.20,  # Adjusted for crypto volatility
                  min_liquidity_ratio=2.0,       # Increased for crypto
-                 margin_call_threshold=0.75):    # More conservative for crypto
+                 margin_call_threshold=0.75,    # More conservative for crypto
+                 asset_returns=None):
         """
         Initialize risk management model with crypto-specific parameters
         
@@ -20,6 +22,8 @@ class CryptoRiskManagementModel:
         - max_drawdown_threshold: Maximum allowed drawdown
         - min_liquidity_ratio: Minimum required liquidity ratio
         - margin_call_threshold: Threshold for margin calls
+        - asset_returns: Daily returns of the collateral assets (one column per
+          asset) for portfolio VaR; defaults to the BTC history alone
         """
         self.lookback_years = lookback_years
         self.confidence_level = confidence_level
@@ -36,6 +40,8 @@ class CryptoRiskManagementModel:
         self.historical_data = self.load_bitcoin_history()
         self.var_model = None
         self.volatility_model = None
+        self.asset_returns = asset_returns
+        self.portfolio_engine = None
     
     def load_bitcoin_history(self):
         """Load historical Bitcoin price data"""
@@ -54,8 +60,29 @@ class CryptoRiskManagementModel:
             'returns': returns
         }, index=dates)
     
-    def calculate_crypto_var(self, portfolio_value, btc_position):
-        """Calculate Value at Risk specifically for crypto positions"""
+    def get_portfolio_engine(self):
+        """Covariance-based risk engine over the collateral assets, built on first use"""
+        if self.portfolio_engine is None:
+            from portfolio_risk import PortfolioRiskEngine
+            returns = self.asset_returns
+            if returns is None:
+                returns = pd.DataFrame({BTC_ASSET: self.historical_data['returns']})
+            self.portfolio_engine = PortfolioRiskEngine(returns, confidence_level=self.confidence_level)
+        return self.portfolio_engine
+    
+    def calculate_crypto_var(self, portfolio_value, btc_position, collateral=None, method='historical'):
+        """
+        Calculate Value at Risk specifically for crypto positions
+        
+        With collateral (asset -> value, or a DataFrame with one row per
+        portfolio) the VaR of the correlated collateral mix is computed by
+        the portfolio engine with the given method ('parametric',
+        'historical' or 'monte_carlo') instead of from portfolio_value.
+        """
+        if collateral is not None:
+            var = self.get_portfolio_engine().risk(collateral, method)['var']
+            var = -var * self.btc_volatility_multiplier
+            return var if len(var) > 1 else var[0]
         returns = self.historical_data['returns'].dropna()
         # Use longer left tail for crypto VaR
         var = np.percentile(returns, (1 - self.confidence_level) * 100) * self.btc_volatility_multiplier
@@ -103,16 +130,16 @@ class CryptoRiskManagementModel:
         Returns performance metrics and risk events
         """
         portfolio = pd.DataFrame(index=self.historical_data.loc[start_date:end_date].index)
-        portfolio['value'] = initial_capital
+        portfolio['value'] = float(initial_capital)
         portfolio['btc_exposure'] = btc_position
         
         risk_events = []
         
-        for date in portfolio.index[1:]:
+        for prev, date in zip(portfolio.index[:-1], portfolio.index[1:]):
             # Daily mark-to-market
             btc_return = self.historical_data.loc[date, 'returns']
-            portfolio_return = btc_return * (portfolio.loc[date-1, 'btc_exposure'])
-            portfolio.loc[date, 'value'] = portfolio.loc[date-1, 'value'] * (1 + portfolio_return)
+            portfolio_return = btc_return * (portfolio.loc[prev, 'btc_exposure'])
+            portfolio.loc[date, 'value'] = portfolio.loc[prev, 'value'] * (1 + portfolio_return)
             
             # Check for risk events
             drawdown = (portfolio.loc[date, 'value'] - initial_capital) / initial_capital
@@ -151,8 +178,16 @@ class CryptoRiskManagementModel:
             'buffer_included': buffer_amount
         }
 
-    def stress_test_crypto(self, btc_position, scenarios):
-        """Run stress tests under different crypto market scenarios"""
+    def stress_test_crypto(self, btc_position, scenarios, collateral=None):
+        """
+        Run stress tests under different crypto market scenarios
+        
+        With collateral (asset -> value) each asset is shocked by the
+        scenario's price_shocks entry for it (default: price_shock) and the
+        volatility is that of the correlated collateral mix.
+        """
+        if collateral is not None:
+            return self._stress_test_collateral(collateral, scenarios)
         results = []
         current_price = self.historical_data['price'].iloc[-1]
         
@@ -175,10 +210,70 @@ class CryptoRiskManagementModel:
             })
         return results
     
-    def estimate_margin_call_probability(self, position_value, current_volatility):
+    def _stress_test_collateral(self, collateral, scenarios):
+        engine = self.get_portfolio_engine()
+        values = pd.Series(engine.exposures(collateral)[0], index=engine.assets)
+        position_value = values.sum()
+        results = []
+        
+        for scenario in scenarios:
+            shocks = pd.Series(scenario.get('price_shocks', {}), dtype=float)
+            shocks = shocks.reindex(values.index).fillna(scenario.get('price_shock', 0))
+            vol_shock = scenario.get('volatility_shock', 0)
+            
+            shocked = values * (1 + shocks)
+            shocked_value = shocked.sum()
+            # Daily return volatility of the shocked mix
+            shocked_volatility = engine.volatility(shocked)[0] / shocked_value * (1 + vol_shock)
+            
+            results.append({
+                'scenario': scenario['name'],
+                'portfolio_impact': (shocked_value - position_value) / position_value,
+                'asset_impact': (shocked - values).to_dict(),
+                'shocked_var': engine.parametric(shocked)['var'][0] * (1 + vol_shock),
+                'margin_call_probability': self.estimate_margin_call_probability(
+                    shocked_value, shocked_volatility, collateral=shocked),
+                'required_additional_margin': self.calculate_margin_requirements(
+                    shocked_value, shocked_volatility) - position_value
+            })
+        return results
+    
+    def stress_test_loan_book(self, btc_price, collateral, loan_amount, scenarios, impact='sqrt'):
+        """
+        Stress the whole loan book, including the liquidation cascade each shock sets off
+        
+        Unlike stress_test_crypto, the collateral sold by forced liquidations
+        pushes the price down further (see liquidation_cascade).
+        
+        Parameters:
+        - btc_price: BTC price before the shock
+        - collateral, loan_amount: BTC collateral and debt per loan
+        - scenarios: dicts with name and price_shock
+        - impact: market impact model name or callable
+        """
+        from liquidation_cascade import LiquidationCascadeSimulator
+        
+        simulator = LiquidationCascadeSimulator(impact)
+        results = []
+        for scenario in scenarios:
+            cascade = simulator.simulate(btc_price, collateral, loan_amount, scenario['price_shock'])
+            results.append({
+                'scenario': scenario['name'],
+                'final_price': cascade['final_price'],
+                'cascade_price_change': cascade['cascade_price_change'],
+                'cascade_depth': cascade['cascade_depth'],
+                'liquidated_loans': cascade['liquidated_loans'],
+                'liquidated_collateral': cascade['liquidated_collateral'],
+                'bad_debt': cascade['bad_debt']
+            })
+        return results
+    
+    def estimate_margin_call_probability(self, position_value, current_volatility, collateral=None):
         """Estimate probability of margin call under current conditions"""
+        from scipy.stats import norm
+        
         # Adjusted for crypto's fat-tailed distribution
-        var_99 = self.calculate_crypto_var(position_value, position_value)
+        var_99 = self.calculate_crypto_var(position_value, position_value, collateral)
         return norm.cdf(-self.margin_call_threshold, 
                        loc=position_value * current_volatility * np.sqrt(252),
                        scale=abs(var_99))
@@ -219,6 +314,22 @@ def main():
     
     stress_test_results = model.stress_test_crypto(position_value, scenarios)
     
+    # Mixed collateral, with correlated BTC/ETH/SOL returns from the market simulator
+    from market_simulator import MarketSimulator
+    panel = MarketSimulator(['BTC-USD', 'ETH-USD', 'SOL-USD'], correlation=0.7,
+                            seed=42).returns_panel(365*7, column='Returns')
+    portfolio_model = CryptoRiskManagementModel(asset_returns=panel)
+    collateral = {'BTC-USD': position_value * 0.6, 'ETH-USD': position_value * 0.3,
+                  'SOL-USD': position_value * 0.1}
+    for method in ('parametric', 'historical', 'monte_carlo'):
+        var = portfolio_model.calculate_crypto_var(position_value, position_value, collateral, method)
+        print(f"Collateral VaR ({method}): ${var:,.0f}")
+    collateral_stress_results = portfolio_model.stress_test_crypto(position_value, scenarios, collateral)
+    for result in collateral_stress_results:
+        print(f"Collateral stress ({result['scenario']}): impact {result['portfolio_impact']:.2%}, "
+              f"shocked VaR ${result['shocked_var']:,.0f}, "
+              f"margin call probability {result['margin_call_probability']:.2%}")
+    
     # Check liquidation risk
     risk_level, action = model.check_liquidation_risk(
         account_value=position_value,
@@ -1,14 +1,35 @@
 # RiskAnalysis.py
 import pandas as pd
 import numpy as np
-from scipy import stats
 import warnings
+from DataPrep import load_market_data
+from profiling import instrumented
 warnings.filterwarnings('ignore')
 
+@instrumented
 class LendingRiskAnalyzer:
-    def __init__(self, csv_path='output/btc_raw_data.csv'):
-        """Initialize risk analyzer with historical data"""
-        self.data = pd.read_csv(csv_path, index_col='Date', parse_dates=True)
+    # Protocol liquidation stages by loan-to-value
+    WARNING_LTV = 0.80
+    MARGIN_CALL_LTV = 0.85
+    LIQUIDATION_LTV = 0.90
+    STAGES = np.array(['healthy', 'warning', 'margin_call', 'liquidation'])
+    MIN_COLLATERAL_BTC = 0.1
+    
+    # Recommended initial LTV is scaled down in more volatile regimes
+    REGIME_LTV_FACTORS = {'Low': 1.0, 'Medium': 0.9, 'High': 0.8}
+    
+    # Stored columns the analysis reads
+    DATA_COLUMNS = ['Close', 'Returns']
+    
+    def __init__(self, csv_path='output/btc_raw_data.csv', data=None):
+        """
+        Initialize risk analyzer with historical data
+        
+        Args:
+            csv_path (str): Raw price data, read only when data is not given
+            data (pd.DataFrame): Already loaded Date-indexed price data
+        """
+        self.data = load_market_data(csv_path, self.DATA_COLUMNS) if data is None else data
         self.analysis_results = {}
         
     def analyze_liquidation_parameters(self, confidence_level=0.99):
@@ -45,6 +66,49 @@ class LendingRiskAnalyzer:
         
         return self.analysis_results['liquidation_params']
     
+    def score_loans(self, btc_price, collateral, loan_amount, risk_level='Medium'):
+        """
+        Score loans against the liquidation stages with array math
+        
+        Args:
+            btc_price: Current BTC price (scalar or one per loan)
+            collateral: BTC collateral per loan
+            loan_amount: Outstanding stablecoin amount per loan
+            risk_level: Current volatility regime ('Low', 'Medium' or 'High')
+        
+        Returns:
+            dict: arrays of current LTV, stage, stage trigger prices and the
+            regime-adjusted recommended LTV and maximum loan
+        """
+        if 'liquidation_params' not in self.analysis_results:
+            self.analyze_liquidation_parameters()
+        
+        btc_price = np.asarray(btc_price, dtype=float)
+        collateral = np.asarray(collateral, dtype=float)
+        loan_amount = np.asarray(loan_amount, dtype=float)
+        collateral_value = collateral * btc_price
+        
+        base_ltv = self.analysis_results['liquidation_params']['recommended_initial_ltv']
+        recommended_ltv = base_ltv * self.REGIME_LTV_FACTORS.get(risk_level, 1.0)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            current_ltv = np.where(collateral_value > 0, loan_amount / collateral_value, np.inf)
+            debt_per_btc = loan_amount / collateral
+        
+        thresholds = [self.WARNING_LTV, self.MARGIN_CALL_LTV, self.LIQUIDATION_LTV]
+        stage = np.searchsorted(thresholds, current_ltv, side='right')
+        
+        return {
+            'current_ltv': current_ltv,
+            'stage': self.STAGES[stage],
+            'recommended_ltv': np.full(current_ltv.shape, recommended_ltv),
+            'max_loan': collateral_value * recommended_ltv,
+            'warning_price': debt_per_btc / self.WARNING_LTV,
+            'margin_call_price': debt_per_btc / self.MARGIN_CALL_LTV,
+            'liquidation_price': debt_per_btc / self.LIQUIDATION_LTV,
+            'below_min_collateral': collateral < self.MIN_COLLATERAL_BTC,
+        }
+    
     def analyze_repayment_windows(self, default_window=5):
         """Analyze optimal repayment windows"""
         returns = self.data['Returns'].dropna()
@@ -161,9 +225,15 @@ class LendingRiskAnalyzer:
         except Exception as e:
             print(f"Error generating report: {str(e)}")
 
-def main():
+def main(argv=None):
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Derive lending protocol parameters from the price history")
+    parser.add_argument('--data-path', default='output/btc_raw_data.csv')
+    args = parser.parse_args(argv)
+    
     # Initialize analyzer
-    analyzer = LendingRiskAnalyzer()
+    analyzer = LendingRiskAnalyzer(args.data_path)
     
     # Run analysis
     results = analyzer.analyze_risk_parameters()
@@ -1,24 +1,99 @@
-# MLModel.py
+# RiskMLModel.py
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split, TimeSeriesSplit
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingRegressor
 from sklearn.metrics import classification_report, mean_squared_error, r2_score
+from joblib import Parallel, delayed
+from contextlib import nullcontext
+import hashlib
+import itertools
+import json
 import pickle
 import os
+import time
+import weakref
+from ahr999_index import compute_ahr999, SMA_WINDOW
+from DataPrep import load_market_data
+from profiling import instrumented, span
 
+FEATURE_COLUMNS = ['Returns', 'Log_Returns', 'Volatility',
+                   'MA5', 'MA20', 'MA50', 'RSI',
+                   'Volume_Ratio', 'Price_Momentum',
+                   'Volatility_5d', 'Volatility_10d', 'Volatility_30d',
+                   'ahr999']
+
+# Scale-free features used for drift checks (moving averages track the price
+# level and ahr999 the market cycle, so both shift without any drift)
+DRIFT_FEATURES = [col for col in FEATURE_COLUMNS if not col.startswith('MA') and col != 'ahr999']
+
+# Bars ahead the volatility and risk level targets look: they describe the
+# annualized volatility of the next FORECAST_HORIZON returns, a window that
+# does not overlap the 30-bar Volatility feature
+FORECAST_HORIZON = 30
+
+# name -> (target column, estimator class, kind)
+MODEL_SPECS = {
+    'risk_level': ('Risk_Level', RandomForestClassifier, 'classifier'),
+    'price_direction': ('Price_Direction', RandomForestClassifier, 'classifier'),
+    'volatility': ('Forward_Volatility', GradientBoostingRegressor, 'regressor'),
+}
+TARGET_COLUMNS = [spec[0] for spec in MODEL_SPECS.values()]
+
+# Metric maximised by the hyperparameter search
+PRIMARY_METRIC = {'classifier': 'accuracy', 'regressor': 'r2'}
+
+DEFAULT_PARAMS = {'n_estimators': 100, 'random_state': 42}
+
+# Hyperparameter search spaces, smallest/cheapest values first
+SEARCH_SPACES = {
+    'risk_level': {'n_estimators': [25, 50, 100, 200], 'max_depth': [5, 10, None],
+                   'min_samples_leaf': [1, 5]},
+    'price_direction': {'n_estimators': [25, 50, 100, 200], 'max_depth': [5, 10, None],
+                        'min_samples_leaf': [1, 5]},
+    'volatility': {'n_estimators': [50, 100, 200], 'max_depth': [2, 3, 4],
+                   'learning_rate': [0.05, 0.1]},
+}
+
+def build_estimator(name, params=None):
+    """Create the estimator for a model name with defaults overridden by params"""
+    return MODEL_SPECS[name][1](**{**DEFAULT_PARAMS, **(params or {})})
+
+@instrumented
 class BitcoinRiskModel:
-    def __init__(self, csv_path='output/btc_raw_data.csv'):
-        """Initialize the ML model"""
-        self.data = pd.read_csv(csv_path, index_col='Date', parse_dates=True)
+    # Stored columns the features are built from; the rest are recomputed
+    DATA_COLUMNS = ['Close', 'Volume']
+    
+    def __init__(self, csv_path='output/btc_raw_data.csv', data=None):
+        """
+        Initialize the ML model
+        
+        Args:
+            csv_path (str): Raw price data, read only when data is not given
+            data (pd.DataFrame): Already loaded Date-indexed price data
+        """
+        self.data = load_market_data(csv_path, self.DATA_COLUMNS) if data is None else data
         self.classifiers = {}
         self.regressors = {}
         self.scalers = {}
+        self.feature_columns = FEATURE_COLUMNS
+        self.params = {}
+        self.update_state = {}
         
-    def create_features(self):
-        """Create features for the model"""
-        df = self.data.copy()
+    def create_features(self, causal_targets=False, data=None):
+        """Create features for the model
+
+        Targets are forecasts: Forward_Volatility is the volatility of the
+        next FORECAST_HORIZON bars, Risk_Level its tercile and
+        Price_Direction the sign of the next return. They are NaN on the
+        latest bars, whose future is not known yet; those rows are kept for
+        scoring. With causal_targets=True the risk level is labelled against
+        expanding (past-only) terciles of the volatility known at each row
+        instead of a full-history qcut. data defaults to the full history;
+        pass a recent slice to build features for new bars only.
+        """
+        df = (self.data if data is None else data).copy()
         
         # Price-based features
         df['Returns'] = df['Close'].pct_change()
@@ -42,15 +117,39 @@ class BitcoinRiskModel:
         for window in [5, 10, 30]:
             df[f'Volatility_{window}d'] = df['Returns'].rolling(window=window).std()
         
+        # Market cycle valuation
+        df['ahr999'] = compute_ahr999(df['Close'])
+        
         # Create target variables
-        df['Risk_Level'] = pd.qcut(df['Volatility'], q=3, labels=['Low', 'Medium', 'High'])
-        df['Price_Direction'] = np.where(df['Returns'].shift(-1) > 0, 1, 0)
+        df['Forward_Volatility'] = df['Volatility'].shift(-FORECAST_HORIZON)
+        if causal_targets:
+            df['Risk_Level'] = self.causal_risk_levels(df['Volatility'], forward=df['Forward_Volatility'])
+        else:
+            df['Risk_Level'] = pd.qcut(df['Forward_Volatility'], q=3, labels=['Low', 'Medium', 'High'])
+        next_return = df['Returns'].shift(-1)
+        df['Price_Direction'] = (next_return > 0).astype(float).where(next_return.notna())
         
-        # Drop NaN values
-        df = df.dropna()
+        # Drop rows without a complete feature history
+        df = df.dropna(subset=self.feature_columns)
         
         return df
     
+    def causal_risk_levels(self, volatility, min_periods=90, forward=None):
+        """
+        Label volatility terciles using only data up to each row
+
+        The terciles are expanding quantiles of volatility; forward (values
+        that become known later, such as Forward_Volatility) is labelled
+        against them instead of volatility itself when given.
+        """
+        lower = volatility.expanding(min_periods=min_periods).quantile(1 / 3)
+        upper = volatility.expanding(min_periods=min_periods).quantile(2 / 3)
+        values = volatility if forward is None else forward
+        levels = pd.Series(np.where(values <= lower, 'Low',
+                                    np.where(values <= upper, 'Medium', 'High')),
+                           index=volatility.index)
+        return levels.where(lower.notna() & values.notna())
+    
     def calculate_rsi(self, prices, period=14):
         """Calculate Relative Strength Index"""
         delta = prices.diff()
@@ -62,11 +161,9 @@ class BitcoinRiskModel:
         return rsi
     
     def prepare_data(self, df, target_col):
-        """Prepare data for modeling"""
-        feature_columns = ['Returns', 'Log_Returns', 'Volatility', 
-                         'MA5', 'MA20', 'MA50', 'RSI',
-                         'Volume_Ratio', 'Price_Momentum',
-                         'Volatility_5d', 'Volatility_10d', 'Volatility_30d']
+        """Prepare data for modeling (rows whose target is not known yet are left out)"""
+        feature_columns = self.feature_columns
+        df = df[df[target_col].notna()]
         
         X = df[feature_columns]
         y = df[target_col]
@@ -77,18 +174,27 @@ class BitcoinRiskModel:
         
         return X_scaled, y, scaler, feature_columns
     
-    def train_models(self):
-        """Train classification and regression models"""
+    def train_models(self, progress=None):
+        """
+        Train classification and regression models
+        
+        Args:
+            progress (callable): optional progress(stage, fraction) callback
+        """
+        progress = progress or (lambda stage, fraction: None)
         print("Training models...")
         
         # Prepare data
+        progress('features', 0.0)
         df = self.create_features()
         
         # Train Risk Level Classifier
+        progress('risk_level', 0.1)
         print("\nTraining Risk Level Classifier...")
         X_risk, y_risk, risk_scaler, risk_features = self.prepare_data(df, 'Risk_Level')
-        risk_clf = RandomForestClassifier(n_estimators=100, random_state=42)
-        risk_clf.fit(X_risk, y_risk)
+        risk_clf = build_estimator('risk_level', self.params.get('risk_level'))
+        with span('fit risk_level'):
+            risk_clf.fit(X_risk, y_risk)
         self.classifiers['risk_level'] = risk_clf
         self.scalers['risk_level'] = risk_scaler
         
@@ -101,23 +207,43 @@ class BitcoinRiskModel:
         print(risk_importance)
         
         # Train Price Direction Classifier
+        progress('price_direction', 0.4)
         print("\nTraining Price Direction Classifier...")
         X_dir, y_dir, dir_scaler, dir_features = self.prepare_data(df, 'Price_Direction')
-        dir_clf = RandomForestClassifier(n_estimators=100, random_state=42)
-        dir_clf.fit(X_dir, y_dir)
+        dir_clf = build_estimator('price_direction', self.params.get('price_direction'))
+        with span('fit price_direction'):
+            dir_clf.fit(X_dir, y_dir)
         self.classifiers['price_direction'] = dir_clf
         self.scalers['price_direction'] = dir_scaler
         
         # Train Volatility Regressor
+        progress('volatility', 0.7)
         print("\nTraining Volatility Regressor...")
-        X_vol, y_vol, vol_scaler, vol_features = self.prepare_data(df, 'Volatility')
-        vol_reg = GradientBoostingRegressor(n_estimators=100, random_state=42)
-        vol_reg.fit(X_vol, y_vol)
+        X_vol, y_vol, vol_scaler, vol_features = self.prepare_data(df, 'Forward_Volatility')
+        vol_reg = build_estimator('volatility', self.params.get('volatility'))
+        with span('fit volatility'):
+            vol_reg.fit(X_vol, y_vol)
         self.regressors['volatility'] = vol_reg
         self.scalers['volatility'] = vol_scaler
         
+        # Reference statistics for incremental updates and drift checks
+        _, risk_bins = pd.qcut(df['Forward_Volatility'].dropna(), q=3, retbins=True)
+        self.update_state = {
+            'last_trained': str(self.data.index[-1]),
+            'risk_bins': [float(b) for b in risk_bins[1:-1]],
+            'train_mean': risk_scaler.mean_.tolist(),
+            'train_var': risk_scaler.var_.tolist(),
+            'running_n': 0,
+            'running_mean': [0.0] * len(risk_features),
+            'running_var': [0.0] * len(risk_features),
+            'updates_since_retrain': 0,
+            'base_stages': int(vol_reg.n_estimators),
+        }
+        
         # Save models and scalers
+        progress('saving', 0.95)
         self.save_models()
+        progress('done', 1.0)
         
     def save_models(self):
         """Save trained models and scalers to pickle files"""
@@ -137,6 +263,15 @@ class BitcoinRiskModel:
                 pickle.dump(model, f)
             with open(f'output/models/{name}_scaler.pkl', 'wb') as f:
                 pickle.dump(self.scalers[name], f)
+        
+        # Save tuned hyperparameters next to the models they produced
+        if self.params:
+            with open('output/models/model_params.json', 'w') as f:
+                json.dump(self.params, f, indent=2)
+        
+        if self.update_state:
+            with open('output/models/update_state.json', 'w') as f:
+                json.dump(self.update_state, f, indent=2)
                 
         print("\nModels saved in output/models/")
     
@@ -156,14 +291,156 @@ class BitcoinRiskModel:
             self.regressors['volatility'] = pickle.load(f)
         with open(f'{model_dir}volatility_scaler.pkl', 'rb') as f:
             self.scalers['volatility'] = pickle.load(f)
+        
+        # Models saved before a feature was added cannot score the current features
+        for name, scaler in self.scalers.items():
+            if scaler.n_features_in_ != len(self.feature_columns):
+                raise ValueError(f"Saved {name} model expects {scaler.n_features_in_} features, "
+                                 f"current feature set has {len(self.feature_columns)}; retrain the models")
+        
+        # Load tuned hyperparameters if a search has been run
+        if os.path.exists(f'{model_dir}model_params.json'):
+            with open(f'{model_dir}model_params.json') as f:
+                self.params = json.load(f)
+        
+        if os.path.exists(f'{model_dir}update_state.json'):
+            with open(f'{model_dir}update_state.json') as f:
+                self.update_state = json.load(f)
+    
+    def update_models(self, new_data=None, recent_window=250, n_new_trees=10, n_new_stages=5,
+                      drift_threshold=1.0, min_accuracy=0.6, max_updates=30, min_drift_bars=20,
+                      progress=None):
+        """
+        Incrementally update the models with bars that arrived since training
+
+        Random forests get n_new_trees trees fitted on the recent window via
+        warm_start and drop their oldest trees, so the forest size stays
+        fixed. The volatility regressor gets n_new_stages warm-started boosting
+        stages. Serving scalers stay frozen so existing trees keep seeing
+        the inputs they were fitted on; instead, running mean and variance of
+        the new bars are merged into update_state and compared with the
+        training statistics as a drift measure.
+
+        A full retrain (train_models) is done instead when there is no
+        trained state, when feature drift exceeds drift_threshold (judged
+        once min_drift_bars new bars have been seen), when the risk
+        classifier's accuracy on the new bars falls below min_accuracy,
+        after max_updates incremental updates, or when the booster has
+        doubled in size.
+
+        Args:
+            new_data (pd.DataFrame): optional OHLCV bars to append to self.data
+            progress (callable): optional progress(stage, fraction) callback,
+                passed on to train_models on fallback
+
+        Returns:
+            dict: update mode ('none', 'incremental' or 'full') and drift metrics
+        """
+        if new_data is not None:
+            self.data = pd.concat([self.data, new_data])
+            self.data = self.data[~self.data.index.duplicated(keep='last')].sort_index()
+        
+        state = self.update_state
+        if not state or not self.classifiers:
+            print("No trained state found, running full retrain...")
+            self.train_models(progress)
+            return {'mode': 'full', 'reason': 'no trained state'}
+        
+        n_new = int((self.data.index > pd.Timestamp(state['last_trained'])).sum())
+        if n_new == 0:
+            return {'mode': 'none', 'reason': 'no new bars'}
+        
+        # Only the recent tail, the bars whose targets are not known yet and the
+        # longest rolling window (the ahr999 SMA cost) are needed
+        df = self.create_features(data=self.data.iloc[
+            -(max(n_new, recent_window) + FORECAST_HORIZON + SMA_WINDOW + 10):])
+        bins = [-np.inf] + state['risk_bins'] + [np.inf]
+        df['Risk_Level'] = pd.cut(df['Forward_Volatility'], bins=bins, labels=['Low', 'Medium', 'High'])
+        fresh = df[df.index > pd.Timestamp(state['last_trained'])]
+        # Rows with known targets; the last n_new of them were labelled since
+        # the last training, as each new bar completes one forward window
+        labelled = df.dropna(subset=TARGET_COLUMNS)
+        labelled = labelled.assign(Risk_Level=labelled['Risk_Level'].astype(str))
+        newly_labelled = labelled.tail(n_new)
+        recent = labelled.tail(recent_window)
+        
+        # Merge running mean/variance of the new bars (Chan et al. parallel update)
+        X_fresh = fresh[self.feature_columns].to_numpy(dtype=float)
+        n_a, n_b = state['running_n'], len(X_fresh)
+        if n_b:
+            mean_a, var_a = np.array(state['running_mean']), np.array(state['running_var'])
+            mean_b, var_b = X_fresh.mean(axis=0), X_fresh.var(axis=0)
+            delta = mean_b - mean_a
+            n = n_a + n_b
+            state['running_mean'] = (mean_a + delta * n_b / n).tolist()
+            state['running_var'] = ((var_a * n_a + var_b * n_b + delta ** 2 * n_a * n_b / n) / n).tolist()
+            state['running_n'] = n
+        
+        # Drift: standardized mean shift since the last full retrain; the log variance
+        # ratio is reported too but is biased low on short windows, so it does not decide
+        cols = [self.feature_columns.index(col) for col in DRIFT_FEATURES]
+        train_mean, train_var = np.array(state['train_mean'])[cols], np.array(state['train_var'])[cols]
+        running_mean, running_var = np.array(state['running_mean'])[cols], np.array(state['running_var'])[cols]
+        mean_shift = np.abs(running_mean - train_mean) / np.sqrt(train_var)
+        var_ratio = np.abs(np.log(np.maximum(running_var, 1e-12) / train_var))
+        drift = float(mean_shift.max())
+        
+        accuracy = None
+        if len(newly_labelled) >= 5:
+            X_risk = self.scalers['risk_level'].transform(newly_labelled[self.feature_columns])
+            predicted = self.classifiers['risk_level'].predict(X_risk)
+            accuracy = float((predicted == newly_labelled['Risk_Level']).mean())
+        
+        metrics = {'new_bars': n_new, 'feature_drift': drift, 'variance_drift': float(var_ratio.max()),
+                   'recent_accuracy': accuracy,
+                   'updates_since_retrain': state['updates_since_retrain']}
+        
+        reason = None
+        if state['running_n'] >= min_drift_bars and drift > drift_threshold:
+            reason = f'feature drift {drift:.2f} > {drift_threshold}'
+        elif accuracy is not None and accuracy < min_accuracy:
+            reason = f'recent accuracy {accuracy:.2f} < {min_accuracy}'
+        elif state['updates_since_retrain'] >= max_updates:
+            reason = f'{max_updates} incremental updates since last retrain'
+        elif self.regressors['volatility'].n_estimators + n_new_stages > 2 * state['base_stages']:
+            reason = 'volatility booster doubled in size'
+        if reason:
+            print(f"Falling back to full retrain: {reason}")
+            self.train_models(progress)
+            return {'mode': 'full', 'reason': reason, **metrics}
+        
+        # Add trees fitted on the recent window and retire the oldest ones
+        skipped = []
+        for name in ['risk_level', 'price_direction']:
+            target = MODEL_SPECS[name][0]
+            window = recent
+            clf = self.classifiers[name]
+            if set(np.unique(window[target])) != set(clf.classes_):
+                # warm_start would re-encode the classes and corrupt existing trees
+                skipped.append(name)
+                continue
+            n_trees = clf.n_estimators
+            clf.set_params(warm_start=True, n_estimators=n_trees + n_new_trees)
+            clf.fit(self.scalers[name].transform(window[self.feature_columns]), window[target])
+            clf.estimators_ = clf.estimators_[n_new_trees:]
+            clf.set_params(warm_start=False, n_estimators=n_trees)
+        
+        reg = self.regressors['volatility']
+        reg.set_params(warm_start=True, n_estimators=reg.n_estimators + n_new_stages)
+        reg.fit(self.scalers['volatility'].transform(recent[self.feature_columns]), recent['Forward_Volatility'])
+        reg.set_params(warm_start=False)
+        
+        state['last_trained'] = str(self.data.index[-1])
+        state['updates_since_retrain'] += 1
+        self.save_models()
+        
+        print(f"Incremental update on {n_new} new bars (drift {drift:.2f})")
+        return {'mode': 'incremental', 'skipped': skipped, **metrics}
     
     def predict(self, input_data):
         """Make predictions using trained models"""
         # Prepare input data
-        feature_columns = ['Returns', 'Log_Returns', 'Volatility', 
-                         'MA5', 'MA20', 'MA50', 'RSI',
-                         'Volume_Ratio', 'Price_Momentum',
-                         'Volatility_5d', 'Volatility_10d', 'Volatility_30d']
+        feature_columns = self.feature_columns
         
         predictions = {}
         
@@ -180,6 +457,324 @@ class BitcoinRiskModel:
         predictions['volatility'] = self.regressors['volatility'].predict(X_vol)
         
         return predictions
+    
+    def predict_matrix(self, X, timer=None):
+        """
+        Predict labels, confidences and volatility from a raw feature matrix
+
+        Single pass per model: class labels are taken from the argmax of the
+        forest probabilities, so confidences come for free. Scaling is done
+        with the fitted scaler statistics directly and forest probabilities
+        are computed without per-call input validation; small inputs walk
+        all trees at once (see _StackedForest), which keeps single-row
+        latency low.
+
+        Args:
+            X (np.ndarray): rows of features in feature_columns order
+            timer: Optional object whose stage(name) context manager times the
+                'scale' and 'predict' steps
+
+        Returns:
+            dict: arrays for each model and '<name>_confidence' for classifiers
+        """
+        stage = timer.stage if timer is not None else (lambda name: nullcontext())
+        X = np.asarray(X, dtype=float)
+        results = {}
+        for name, clf in self.classifiers.items():
+            with stage('scale'):
+                scaled = self._scale(name, X)
+            with stage('predict'):
+                proba = _forest_proba(clf, scaled)
+                best = proba.argmax(axis=1)
+                results[name] = clf.classes_[best]
+                results[f'{name}_confidence'] = proba[np.arange(len(best)), best]
+        for name, reg in self.regressors.items():
+            with stage('scale'):
+                scaled = self._scale(name, X)
+            with stage('predict'):
+                results[name] = reg.predict(scaled)
+        return results
+    
+    def _scale(self, name, X):
+        """Apply a fitted StandardScaler without sklearn's per-call checks"""
+        scaler = self.scalers[name]
+        return (X - scaler.mean_) / scaler.scale_
+    
+    def walk_forward_folds(self, n_rows, min_train_size=500, test_size=90, gap=FORECAST_HORIZON):
+        """
+        Start-anchored walk-forward folds built with TimeSeriesSplit
+
+        Only complete test windows are used, so appending new bars adds new
+        folds without moving the boundaries of the existing ones. The gap
+        keeps the forward targets of the last training rows, which look
+        FORECAST_HORIZON bars ahead, out of the test window.
+        """
+        n_splits = (n_rows - min_train_size) // test_size
+        if n_splits < 1:
+            raise ValueError(f"Need at least {min_train_size + test_size} rows for walk-forward evaluation")
+        
+        usable = min_train_size + n_splits * test_size
+        splitter = TimeSeriesSplit(n_splits=n_splits, test_size=test_size, gap=gap)
+        return list(splitter.split(np.arange(usable)))
+    
+    def walk_forward_evaluate(self, min_train_size=500, test_size=90, gap=FORECAST_HORIZON,
+                              n_jobs=-1, metrics_path='output/models/walk_forward_metrics.json',
+                              force=False):
+        """
+        Walk-forward backtest of all models without lookahead
+
+        Each fold refits its own scalers and models on the training window
+        only and scores the following test window. Folds run in parallel.
+        Per-fold metrics are cached in metrics_path together with a
+        fingerprint of the rows they depend on, so after new data arrives
+        only new or changed folds are recomputed.
+
+        Returns:
+            dict: per-fold metrics and test-size weighted overall metrics
+        """
+        df = self.create_features(causal_targets=True).dropna(subset=TARGET_COLUMNS)
+        folds = self.walk_forward_folds(len(df), min_train_size, test_size, gap)
+        
+        # Each fold depends on every row up to the end of its test window
+        row_hashes = pd.util.hash_pandas_object(
+            df[self.feature_columns + TARGET_COLUMNS],
+            index=True).values
+        settings = f"{min_train_size}:{test_size}:{gap}:{json.dumps(self.params, sort_keys=True)}"
+        fingerprints = [
+            hashlib.sha1(settings.encode() + row_hashes[:test_idx[-1] + 1].tobytes()).hexdigest()
+            for _, test_idx in folds
+        ]
+        
+        cached = {}
+        if not force and os.path.exists(metrics_path):
+            with open(metrics_path) as f:
+                cached = {fold['fingerprint']: fold for fold in json.load(f).get('folds', [])}
+        
+        pending = [i for i, fp in enumerate(fingerprints) if fp not in cached]
+        print(f"Walk-forward: {len(folds)} folds, {len(folds) - len(pending)} cached, "
+              f"{len(pending)} to run")
+        
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_evaluate_fold)(df.iloc[folds[i][0]], df.iloc[folds[i][1]],
+                                    self.feature_columns, self.params)
+            for i in pending
+        )
+        for i, metrics in zip(pending, results):
+            cached[fingerprints[i]] = metrics
+        
+        fold_metrics = []
+        for i, (train_idx, test_idx) in enumerate(folds):
+            fold = dict(cached[fingerprints[i]])
+            fold.update({
+                'fold': i,
+                'fingerprint': fingerprints[i],
+                'train_end': str(df.index[train_idx[-1]]),
+                'test_start': str(df.index[test_idx[0]]),
+                'test_end': str(df.index[test_idx[-1]]),
+                'n_train': len(train_idx),
+                'n_test': len(test_idx),
+            })
+            fold_metrics.append(fold)
+        
+        weights = np.array([fold['n_test'] for fold in fold_metrics], dtype=float)
+        overall = {}
+        for name in MODEL_SPECS:
+            for metric in fold_metrics[0][name]:
+                values = np.array([fold[name][metric] for fold in fold_metrics])
+                overall.setdefault(name, {})[metric] = float(np.average(values, weights=weights))
+        
+        report = {'settings': {'min_train_size': min_train_size, 'test_size': test_size, 'gap': gap},
+                  'folds': fold_metrics,
+                  'overall': overall}
+        
+        os.makedirs(os.path.dirname(metrics_path), exist_ok=True)
+        with open(metrics_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Walk-forward metrics saved to {metrics_path}")
+        
+        return report
+    
+    def tune_hyperparameters(self, models=None, budget_seconds=600, eta=3, tolerance=0.005,
+                             min_train_size=500, test_size=90, gap=FORECAST_HORIZON, n_jobs=-1):
+        """
+        Successive-halving hyperparameter search on the walk-forward folds
+
+        Every candidate starts on the most recent fold; after each rung the
+        best 1/eta survive and are scored on eta times as many folds. The
+        search stops when one candidate is left, all folds are used or the
+        wall-clock budget runs out. Among the final rung, the cheapest
+        configuration (lowest predict latency) whose score is within
+        tolerance of the best is chosen, so smaller models win when the
+        accuracy loss is negligible.
+
+        The chosen configurations are stored in self.params and saved with
+        the models by save_models().
+
+        Returns:
+            dict: per-model search summary (chosen params, score, latency)
+        """
+        started = time.monotonic()
+        df = self.create_features(causal_targets=True).dropna(subset=TARGET_COLUMNS)
+        # Most recent folds first, so short rungs score on current market regimes
+        folds = self.walk_forward_folds(len(df), min_train_size, test_size, gap)[::-1]
+        summary = {}
+        
+        models = models or list(MODEL_SPECS)
+        for i, name in enumerate(models):
+            # Split what is left of the budget evenly over the remaining models
+            remaining = budget_seconds - (time.monotonic() - started)
+            deadline = time.monotonic() + remaining / (len(models) - i)
+            space = SEARCH_SPACES[name]
+            candidates = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+            n_folds = 1
+            scored = []
+            print(f"\nTuning {name}: {len(candidates)} candidates, {remaining / (len(models) - i):.0f}s budget")
+            
+            while True:
+                jobs = [(c, f) for c in range(len(candidates)) for f in range(n_folds)]
+                results = []
+                # Dispatch in core-sized batches so the budget is checked between them
+                batch_size = max(1, os.cpu_count() if n_jobs == -1 else n_jobs)
+                for start in range(0, len(jobs), batch_size):
+                    if results and time.monotonic() > deadline:
+                        break
+                    batch = jobs[start:start + batch_size]
+                    results.extend(Parallel(n_jobs=n_jobs)(
+                        delayed(_fit_and_score)(name, candidates[c], df.iloc[folds[f][0]],
+                                                df.iloc[folds[f][1]], self.feature_columns)
+                        for c, f in batch
+                    ))
+                
+                # Only candidates scored on every fold of this rung are comparable
+                metric = PRIMARY_METRIC[MODEL_SPECS[name][2]]
+                per_candidate = {}
+                for (c, _), (metrics, latency) in zip(jobs, results):
+                    per_candidate.setdefault(c, []).append((metrics[metric], latency))
+                rung = [(float(np.mean([s for s, _ in r])), float(np.mean([l for _, l in r])), candidates[c])
+                        for c, r in per_candidate.items() if len(r) == n_folds]
+                if len(rung) < len(candidates) and scored:
+                    # Budget ran out mid-rung: keep the last complete rung
+                    break
+                if not rung:
+                    raise RuntimeError(f"Budget exhausted before any {name} candidate was scored")
+                scored, scored_folds = rung, n_folds
+                scored.sort(key=lambda item: -item[0])
+                print(f"  rung with {n_folds} fold(s): best score {scored[0][0]:.4f} "
+                      f"over {len(scored)} candidates")
+                
+                if (len(scored) <= 1 or n_folds >= len(folds)
+                        or time.monotonic() > deadline):
+                    break
+                candidates = [params for _, _, params in scored[:max(1, len(scored) // eta)]]
+                n_folds = min(len(folds), n_folds * eta)
+            
+            best_score = scored[0][0]
+            score, latency, params = min(
+                (item for item in scored if item[0] >= best_score - tolerance),
+                key=lambda item: item[1]
+            )
+            self.params[name] = params
+            summary[name] = {'params': params, 'score': score, 'best_score': best_score,
+                             'predict_latency_ms': latency * 1000, 'n_folds': scored_folds}
+            print(f"  chosen {params} (score {score:.4f}, {latency * 1000:.2f} ms per predict)")
+        
+        return summary
+
+# Up to this many rows all trees of a forest are walked together; larger
+# batches are faster tree by tree through sklearn's compiled apply
+STACKED_MAX_ROWS = 64
+
+class _StackedForest:
+    """
+    The nodes of every tree of a fitted forest in flat arrays
+
+    All trees are walked in lockstep, one numpy step per tree level, so a
+    single row costs max_depth vectorized steps instead of one sklearn call
+    per tree. Leaves point to themselves and compare against +inf, so rows
+    that reach a leaf early stay there.
+    """
+    
+    def __init__(self, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+        self.estimators = forest.estimators_
+        self.n_trees = len(trees)
+        self.roots = offsets
+        self.depth = max(tree.max_depth for tree in trees)
+        self.feature = np.concatenate([tree.feature for tree in trees])
+        self.threshold = np.concatenate([tree.threshold for tree in trees])
+        self.missing_left = np.concatenate([tree.missing_go_to_left for tree in trees]).astype(bool)
+        self.left = np.concatenate([tree.children_left + offset for tree, offset in zip(trees, offsets)])
+        self.right = np.concatenate([tree.children_right + offset for tree, offset in zip(trees, offsets)])
+        leaf = self.feature < 0
+        nodes = np.arange(len(leaf))
+        self.left[leaf] = self.right[leaf] = nodes[leaf]
+        self.feature[leaf] = 0
+        self.threshold[leaf] = np.inf
+        value = np.concatenate([tree.value[:, 0, :] for tree in trees])
+        self.value = value / value.sum(axis=1, keepdims=True)
+    
+    def proba(self, X):
+        """Class probabilities of float32 rows averaged over the trees"""
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees))
+        for _ in range(self.depth):
+            x = X[rows, self.feature[node]]
+            go_left = (x <= self.threshold[node]) | (np.isnan(x) & self.missing_left[node])
+            node = np.where(go_left, self.left[node], self.right[node])
+        return self.value[node].mean(axis=1)
+
+# Stacked node arrays per fitted forest, rebuilt when its trees change
+# (incremental updates replace the estimators_ list)
+_stacked_forests = weakref.WeakKeyDictionary()
+
+def _forest_proba(forest, X):
+    """Average tree probabilities the way RandomForestClassifier does"""
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    if len(X) <= STACKED_MAX_ROWS:
+        stacked = _stacked_forests.get(forest)
+        if stacked is None or stacked.estimators is not forest.estimators_:
+            stacked = _stacked_forests[forest] = _StackedForest(forest)
+        return stacked.proba(X)
+    proba = 0
+    for tree in forest.estimators_:
+        # Leaf class distributions looked up directly from the fitted tree
+        leaf = tree.tree_.value[tree.tree_.apply(X), 0, :]
+        proba = proba + leaf / leaf.sum(axis=1, keepdims=True)
+    return proba / len(forest.estimators_)
+
+def _fit_and_score(name, params, train, test, feature_columns):
+    """
+    Fit one model on a training window and score it on the test window
+
+    Returns:
+        tuple: (metrics dict, seconds per predict call on the test window)
+    """
+    target, _, kind = MODEL_SPECS[name]
+    scaler = StandardScaler()
+    X_train = scaler.fit_transform(train[feature_columns])
+    X_test = scaler.transform(test[feature_columns])
+    
+    est = build_estimator(name, params)
+    est.fit(X_train, train[target])
+    start = time.perf_counter()
+    y_pred = est.predict(X_test)
+    latency = time.perf_counter() - start
+    
+    if kind == 'classifier':
+        report = classification_report(test[target], y_pred, output_dict=True, zero_division=0)
+        metrics = {'accuracy': report['accuracy'],
+                   'macro_f1': report['macro avg']['f1-score']}
+    else:
+        metrics = {'r2': r2_score(test[target], y_pred),
+                   'rmse': float(np.sqrt(mean_squared_error(test[target], y_pred)))}
+    return metrics, latency
+
+def _evaluate_fold(train, test, feature_columns, params=None):
+    """Fit every model on one training window and score its test window"""
+    params = params or {}
+    return {name: _fit_and_score(name, params.get(name), train, test, feature_columns)[0]
+            for name in MODEL_SPECS}
 
 def main():
     # Initialize and train models
@@ -1,52 +1,141 @@
 # RiskVisualization.py
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy import stats
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import json
+import os
+from DataPrep import load_market_data
+from downsampling import downsample
+import profiling
+from profiling import instrumented, span
 
+# matplotlib and scipy are imported inside the plot methods, so a run where
+# every figure is up to date does not pay for importing them
+
+# Set in render worker processes by _init_render_worker
+_worker_visualizer = None
+
+def _init_render_worker(visualizer):
+    """Give a render worker a headless backend and its copy of the visualizer"""
+    global _worker_visualizer
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+    _worker_visualizer = visualizer
+
+def _render(method):
+    """Render one figure in a worker process (with its profiling spans, if enabled)"""
+    getattr(_worker_visualizer, method)()
+    return method, profiling.drain()
+
+@instrumented
 class RiskVisualizer:
-    def __init__(self, csv_path='output/btc_raw_data.csv'):
-        """Initialize visualizer with data"""
-        self.data = pd.read_csv(csv_path, index_col='Date', parse_dates=True)
+    # Plot methods in report order: display name, output file name and the
+    # data columns the figure depends on
+    PLOTS = [
+        ('plot_price_and_volatility', 'Price and Volatility', 'price_and_volatility', ['Close', 'Returns']),
+        ('plot_drawdown_analysis', 'Drawdown Analysis', 'drawdown_analysis', ['Close']),
+        ('plot_return_distribution', 'Return Distribution', 'return_distribution', ['Returns']),
+        ('plot_recovery_patterns', 'Recovery Patterns', 'recovery_patterns', ['Close', 'Returns']),
+        ('plot_interest_rate_model', 'Interest Rate Model', 'interest_rate_model', ['Returns']),
+        ('plot_volatility_regimes', 'Volatility Regimes', 'volatility_regimes', ['Returns']),
+    ]
+    
+    # Bump when the look of the figures changes so cached ones are re-rendered
+    STYLE_VERSION = 3
+    FINGERPRINT_FILE = 'fingerprints.json'
+    # Stored columns any figure reads
+    DATA_COLUMNS = sorted({column for *_, columns in PLOTS for column in columns})
+    
+    def __init__(self, csv_path='output/btc_raw_data.csv', formats=('png',), dpi=300,
+                 max_points=None, downsample_method='minmax', data=None):
+        """
+        Initialize visualizer with data
+        
+        Args:
+            csv_path (str): Path to the raw price data
+            formats (tuple): File formats each figure is saved in (e.g. 'png', 'svg', 'pdf')
+            dpi (int): Resolution of raster formats
+            max_points (int): Points per time-series line after downsampling
+                (default: the figure width in pixels)
+            downsample_method (str): 'minmax' (keeps every peak and trough) or 'lttb'
+            data (pd.DataFrame): Already loaded Date-indexed price data (csv_path is then not read)
+        """
+        self.data = load_market_data(csv_path, self.DATA_COLUMNS) if data is None else data
         self.output_dir = 'output/figures/'
-        import os
+        self.formats = tuple(formats)
+        self.dpi = dpi
+        self.max_points = max_points
+        self.downsample_method = downsample_method
+        self._series = None
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
             
+    def shared_series(self):
+        """Derived series used by several figures, computed once"""
+        if self._series is None:
+            returns = self.data['Returns']
+            rolling_max = self.data['Close'].expanding().max()
+            self._series = {
+                'returns': returns.dropna(),
+                'volatility_30d': returns.rolling(window=30).std() * np.sqrt(252),
+                'drawdown': (self.data['Close'] - rolling_max) / rolling_max,
+            }
+        return self._series
+    
+    def figure_fingerprint(self, name, columns):
+        """Hash of a figure's data columns (with dates), render settings and style version"""
+        row_hashes = pd.util.hash_pandas_object(self.data[columns], index=True).values
+        settings = (f"{name}:{self.STYLE_VERSION}:{self.dpi}:{','.join(self.formats)}:"
+                    f"{self.max_points}:{self.downsample_method}")
+        return hashlib.sha1(settings.encode() + row_hashes.tobytes()).hexdigest()
+    
+    def _thin(self, fig, series):
+        """Downsample a time series to about the figure's width in pixels"""
+        n_out = self.max_points or int(fig.get_figwidth() * self.dpi)
+        return downsample(series.index, series, n_out, self.downsample_method)
+    
+    def _save(self, name):
+        """Save the current figure in every configured format and close it"""
+        import matplotlib.pyplot as plt
+        with span(f'savefig {name}'):
+            for fmt in self.formats:
+                plt.savefig(f'{self.output_dir}{name}.{fmt}', dpi=self.dpi, bbox_inches='tight')
+        plt.close()
+        
     def plot_price_and_volatility(self):
         """Plot price trend and volatility"""
+        import matplotlib.pyplot as plt
         fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(15, 10), height_ratios=[2, 1])
         
         # Price plot
-        ax1.plot(self.data.index, self.data['Close'], 'b-', label='BTC Price')
+        ax1.plot(*self._thin(fig, self.data['Close']), 'b-', label='BTC Price')
         ax1.set_title('Bitcoin Price History', fontsize=12)
         ax1.set_ylabel('Price (USD)', fontsize=10)
         ax1.grid(True, alpha=0.3)
         ax1.legend(fontsize=10)
         
         # Volatility plot
-        rolling_vol = self.data['Returns'].rolling(window=30).std() * np.sqrt(252)
-        ax2.plot(self.data.index, rolling_vol, 'r-', label='30-Day Volatility')
+        rolling_vol = self.shared_series()['volatility_30d']
+        ax2.plot(*self._thin(fig, rolling_vol), 'r-', label='30-Day Volatility')
         ax2.set_title('Historical Volatility (30-Day)', fontsize=12)
         ax2.set_ylabel('Annualized Volatility', fontsize=10)
         ax2.grid(True, alpha=0.3)
         ax2.legend(fontsize=10)
         
         plt.tight_layout()
-        plt.savefig(f'{self.output_dir}price_and_volatility.png', dpi=300, bbox_inches='tight')
-        plt.close()
+        self._save('price_and_volatility')
         
     def plot_drawdown_analysis(self):
         """Plot drawdown patterns"""
+        import matplotlib.pyplot as plt
         fig, ax = plt.subplots(figsize=(15, 7))
         
-        # Calculate drawdown
-        rolling_max = self.data['Close'].expanding().max()
-        drawdown = (self.data['Close'] - rolling_max) / rolling_max
+        dates, drawdown = self._thin(fig, self.shared_series()['drawdown'])
         
-        ax.fill_between(self.data.index, drawdown, 0, color='red', alpha=0.3)
-        ax.plot(self.data.index, drawdown, 'r-', label='Drawdown')
+        ax.fill_between(dates, drawdown, 0, color='red', alpha=0.3)
+        ax.plot(dates, drawdown, 'r-', label='Drawdown')
         
         ax.set_title('Bitcoin Historical Drawdown', fontsize=12)
         ax.set_ylabel('Drawdown %', fontsize=10)
@@ -54,12 +143,13 @@ class RiskVisualizer:
         ax.legend(fontsize=10)
         
         plt.tight_layout()
-        plt.savefig(f'{self.output_dir}drawdown_analysis.png', dpi=300, bbox_inches='tight')
-        plt.close()
+        self._save('drawdown_analysis')
         
     def plot_return_distribution(self):
         """Plot return distribution and VaR"""
-        returns = self.data['Returns'].dropna()
+        import matplotlib.pyplot as plt
+        from scipy import stats
+        returns = self.shared_series()['returns']
         
         fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(15, 10))
         
@@ -80,12 +170,12 @@ class RiskVisualizer:
         ax2.grid(True, alpha=0.3)
         
         plt.tight_layout()
-        plt.savefig(f'{self.output_dir}return_distribution.png', dpi=300, bbox_inches='tight')
-        plt.close()
+        self._save('return_distribution')
         
     def plot_recovery_patterns(self):
         """Plot recovery patterns after significant drops"""
-        returns = self.data['Returns'].dropna()
+        import matplotlib.pyplot as plt
+        returns = self.shared_series()['returns']
         significant_drops = returns < returns.quantile(0.05)
         
         # Get recovery patterns
@@ -98,29 +188,33 @@ class RiskVisualizer:
                 recovery_series = self.data['Close'].iloc[i:i+window] / initial_price - 1
                 recovery_paths.append(recovery_series)
         
+        fig, ax = plt.subplots(figsize=(15, 7))
+        
         if recovery_paths:
-            fig, ax = plt.subplots(figsize=(15, 7))
-            
             for path in recovery_paths[:20]:  # Plot first 20 patterns
                 ax.plot(range(len(path)), path, alpha=0.2, color='gray')
                 
-            # Plot median recovery path
-            median_path = pd.DataFrame(recovery_paths).median()
+            # Plot median recovery path (by days after the drop, not by date)
+            median_path = np.median([path.to_numpy() for path in recovery_paths], axis=0)
             ax.plot(range(len(median_path)), median_path, 'b-', 
                    linewidth=2, label='Median Recovery')
-            
-            ax.set_title('Price Recovery Patterns After Significant Drops', fontsize=12)
-            ax.set_xlabel('Days After Drop', fontsize=10)
-            ax.set_ylabel('Return from Bottom', fontsize=10)
-            ax.grid(True, alpha=0.3)
             ax.legend(fontsize=10)
-            
-            plt.tight_layout()
-            plt.savefig(f'{self.output_dir}recovery_patterns.png', dpi=300, bbox_inches='tight')
-            plt.close()
+        else:
+            # Still written, so the figure on disk always matches its fingerprint
+            ax.text(0.5, 0.5, f'No significant drops with {window} days of history after them',
+                    ha='center', va='center', transform=ax.transAxes, fontsize=12)
+        
+        ax.set_title('Price Recovery Patterns After Significant Drops', fontsize=12)
+        ax.set_xlabel('Days After Drop', fontsize=10)
+        ax.set_ylabel('Return from Bottom', fontsize=10)
+        ax.grid(True, alpha=0.3)
+        
+        plt.tight_layout()
+        self._save('recovery_patterns')
             
     def plot_interest_rate_model(self):
         """Plot interest rate model based on utilization"""
+        import matplotlib.pyplot as plt
         utilization = np.linspace(0, 1, 100)
         
         # Calculate interest rates
@@ -149,17 +243,17 @@ class RiskVisualizer:
         ax.legend(fontsize=10)
         
         plt.tight_layout()
-        plt.savefig(f'{self.output_dir}interest_rate_model.png', dpi=300, bbox_inches='tight')
-        plt.close()
+        self._save('interest_rate_model')
     
     def plot_volatility_regimes(self):
         """Plot volatility regimes"""
-        vol = self.data['Returns'].rolling(window=30).std() * np.sqrt(252)
+        import matplotlib.pyplot as plt
+        vol = self.shared_series()['volatility_30d']
         vol_percentiles = vol.quantile([0.33, 0.67])
         
         fig, ax = plt.subplots(figsize=(15, 7))
         
-        ax.plot(self.data.index, vol, 'b-', label='30-Day Volatility')
+        ax.plot(*self._thin(fig, vol), 'b-', label='30-Day Volatility')
         ax.axhline(vol_percentiles[0.33], color='g', linestyle='--', label='Low/Medium Threshold')
         ax.axhline(vol_percentiles[0.67], color='r', linestyle='--', label='Medium/High Threshold')
         
@@ -169,29 +263,85 @@ class RiskVisualizer:
         ax.legend(fontsize=10)
         
         plt.tight_layout()
-        plt.savefig(f'{self.output_dir}volatility_regimes.png', dpi=300, bbox_inches='tight')
-        plt.close()
+        self._save('volatility_regimes')
+        
+    def generate_all_plots(self, parallel=False, workers=None, force=False):
+        """
+        Generate all visualization plots
         
-    def generate_all_plots(self):
-        """Generate all visualization plots"""
+        Figures whose fingerprint matches the one recorded in
+        FINGERPRINT_FILE and whose files all exist are skipped.
+        
+        Args:
+            parallel (bool): Render the figures in a process pool with the
+                headless Agg backend; the shared series are computed once
+                here and shipped to the workers with the data
+            workers (int): Pool size (default: one per stale figure, up to the CPU count)
+            force (bool): Re-render every figure regardless of fingerprints
+        
+        Returns:
+            dict: names of the 'rebuilt' and 'skipped' figures
+        """
         print("Generating visualizations...")
-        self.plot_price_and_volatility()
-        print("1. Price and Volatility plot generated")
-        self.plot_drawdown_analysis()
-        print("2. Drawdown Analysis plot generated")
-        self.plot_return_distribution()
-        print("3. Return Distribution plot generated")
-        self.plot_recovery_patterns()
-        print("4. Recovery Patterns plot generated")
-        self.plot_interest_rate_model()
-        print("5. Interest Rate Model plot generated")
-        self.plot_volatility_regimes()
-        print("6. Volatility Regimes plot generated")
+        manifest_path = os.path.join(self.output_dir, self.FINGERPRINT_FILE)
+        manifest = {}
+        if not force and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        
+        fingerprints = {name: self.figure_fingerprint(name, columns) for _, _, name, columns in self.PLOTS}
+        stale = [
+            (method, label, name) for method, label, name, _ in self.PLOTS
+            if manifest.get(name) != fingerprints[name]
+            or not all(os.path.exists(f'{self.output_dir}{name}.{fmt}') for fmt in self.formats)
+        ]
+        labels = {method: label for method, label, _, _ in self.PLOTS}
+        
+        if stale and not parallel:
+            for i, (method, label, _) in enumerate(stale, 1):
+                getattr(self, method)()
+                print(f"{i}. {label} plot generated")
+        elif stale:
+            # Computed before the visualizer is pickled, so workers reuse them
+            self.shared_series()
+            workers = workers or min(len(stale), os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker,
+                                     initargs=(self,)) as pool:
+                futures = [pool.submit(_render, method) for method, _, _ in stale]
+                for i, future in enumerate(as_completed(futures), 1):
+                    method, trace = future.result()
+                    profiling.merge(trace)
+                    print(f"{i}. {labels[method]} plot generated")
+        
+        rebuilt = [name for _, _, name in stale]
+        for name in rebuilt:
+            manifest[name] = fingerprints[name]
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        
+        skipped = [name for _, _, name, _ in self.PLOTS if name not in rebuilt]
+        print(f"Rebuilt {len(rebuilt)} of {len(self.PLOTS)} figures"
+              + (f", {len(skipped)} unchanged: {', '.join(skipped)}" if skipped else ""))
         print(f"\nAll plots saved in {self.output_dir}")
+        return {'rebuilt': rebuilt, 'skipped': skipped}
 
-def main():
-    visualizer = RiskVisualizer()
-    visualizer.generate_all_plots()
+def main(argv=None):
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Generate risk analysis figures")
+    parser.add_argument('--parallel', action='store_true', help="Render figures in a process pool")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--formats', nargs='+', default=['png'], help="Output formats, e.g. png svg pdf")
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--max-points', type=int, default=None,
+                        help="Points per time-series line (default: figure width in pixels)")
+    parser.add_argument('--downsample', choices=['minmax', 'lttb'], default='minmax')
+    parser.add_argument('--force', action='store_true', help="Re-render figures even if their inputs are unchanged")
+    args = parser.parse_args(argv)
+    
+    visualizer = RiskVisualizer(formats=args.formats, dpi=args.dpi, max_points=args.max_points,
+                                downsample_method=args.downsample)
+    visualizer.generate_all_plots(parallel=args.parallel, workers=args.workers, force=args.force)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,13 +1,221 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates  # For date formatting
+import threading
+import mmap
+import multiprocessing
+import time
 from datetime import datetime, timezone
+from downsampling import downsample
+
+# matplotlib is imported in plot_ahr999_index only, so the engine below can
+# be used by the API and the model without it
+
+# Bitcoin genesis block; the growth valuation is a function of Bitcoin's age in days
+GENESIS_DATE = np.datetime64('2009-01-03')
+
+# Window of the SMA cost
+SMA_WINDOW = 200
+
+# Upper bounds of the ahr999 zones
+ZONES = [(0.45, 'buy'), (1.2, 'accumulate'), (5.0, 'wait'), (np.inf, 'overheated')]
+
+def to_datetime64(dates):
+    """
+    Convert dates to naive UTC datetime64[s]
+    
+    Accepts a DatetimeIndex or datetime Series (naive means UTC; aware ones
+    are converted) or an array of epoch seconds.
+    """
+    if getattr(dates, 'tz', None) is not None:
+        dates = dates.tz_convert(None)
+    elif hasattr(dates, 'dt') and dates.dt.tz is not None:
+        dates = dates.dt.tz_convert(None)
+    values = np.asarray(dates)
+    if np.issubdtype(values.dtype, np.number):
+        return values.astype(np.int64).astype('datetime64[s]')
+    return values.astype('datetime64[s]')
+
+def growth_valuation(dates):
+    """Exponential-growth valuation 10^(5.84 * log10(age in days) - 17.01)"""
+    age_days = (to_datetime64(dates).astype('datetime64[D]') - GENESIS_DATE).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 10 ** (5.84 * np.log10(age_days) - 17.01)
+
+def compute_ahr999(closes, window=SMA_WINDOW):
+    """
+    ahr999 index for one or several assets in one vectorized pass
+    
+    Args:
+        closes (pd.Series or pd.DataFrame): Closing prices indexed by date,
+            one column per asset
+        window (int): SMA cost window
+    
+    Returns:
+        Same shape as closes; NaN until window closes are available
+    """
+    sma = closes.rolling(window=window).mean()
+    growth = growth_valuation(closes.index)
+    return (closes / sma) * closes.div(growth, axis=0)
+
+def ahr999_zone(value):
+    """Zone name of an ahr999 value ('buy', 'accumulate', 'wait' or 'overheated')"""
+    if not np.isfinite(value):
+        return None
+    return next(name for bound, name in ZONES if value < bound)
+
+class AHR999Engine:
+    """
+    Incremental ahr999 index for several assets
+    
+    Each asset keeps its last `window` closes in a ring buffer together
+    with their running sum, so a new bar updates the SMA cost in O(1) no
+    matter how long the history is, and a batch of bars for many assets
+    is applied in one vectorized step. All state lives in one flat float64
+    buffer that share() moves into shared memory before worker processes
+    are forked, like RollingFeatureState.
+    """
+    
+    def __init__(self, symbols, window=SMA_WINDOW, interval=86400.0):
+        """
+        Args:
+            symbols (list): Asset symbols, fixed for the engine's lifetime
+            window (int): SMA cost window
+            interval (float): Bar spacing in seconds
+        """
+        self.symbols = list(symbols)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.window = window
+        self.interval = float(interval)
+        n = len(self.symbols)
+        self._attach(np.zeros(n * window + 4 * n))
+        self.ring[:] = np.nan
+        self.last_timestamp[:] = -np.inf
+        self._lock = threading.Lock()
+    
+    def _attach(self, buffer):
+        """Point the state views at a flat float64 buffer"""
+        n, w = len(self.symbols), self.window
+        self._buffer = buffer
+        self.ring = buffer[:n * w].reshape(n, w)
+        self.sums, self.counts, self.positions, self.last_timestamp = buffer[n * w:].reshape(4, n)
+    
+    def share(self):
+        """Move the state into anonymous shared memory (call before forking)"""
+        shared = np.frombuffer(mmap.mmap(-1, self._buffer.nbytes), dtype=float)
+        shared[:] = self._buffer
+        self._attach(shared)
+        self._lock = multiprocessing.Lock()
+        return self
+    
+    @classmethod
+    def from_history(cls, closes, window=SMA_WINDOW):
+        """
+        Seed an engine from a date-indexed DataFrame of closes (one column per asset)
+        
+        Only the last `window` closes of each asset are kept; the bar
+        interval is the median spacing of the dates.
+        """
+        spacing = closes.index.to_series().diff().median()
+        engine = cls(closes.columns, window, spacing.total_seconds() if pd.notna(spacing) else 86400.0)
+        for i, symbol in enumerate(engine.symbols):
+            series = closes[symbol].dropna().tail(window)
+            k = len(series)
+            engine.ring[i, :k] = series.to_numpy()
+            engine.sums[i] = series.sum()
+            engine.counts[i] = k
+            engine.positions[i] = k % window
+            if k:
+                engine.last_timestamp[i] = to_datetime64(series.index[-1:])[0].astype(np.int64)
+        return engine
+    
+    def update(self, symbols, timestamps, closes):
+        """
+        Fold one bar per asset into the state
+        
+        A bar newer than an asset's latest bar is appended; one with the
+        same timestamp replaces the latest bar (intra-bar update). Bars more
+        than one interval after both the asset's latest bar and the current
+        time are rejected.
+        
+        Args:
+            symbols (list): Distinct asset symbols
+            timestamps (array): Epoch seconds of the bars
+            closes (array): Closing prices
+        """
+        try:
+            rows = np.array([self.index[symbol] for symbol in symbols], dtype=int)
+        except KeyError as e:
+            raise ValueError(f"Unknown asset: {e.args[0]}")
+        if len(np.unique(rows)) != len(rows):
+            raise ValueError("Each asset can only get one bar per update")
+        timestamps = np.asarray(timestamps, dtype=float)
+        closes = np.asarray(closes, dtype=float)
+        
+        with self._lock:
+            if (timestamps < self.last_timestamp[rows]).any():
+                raise ValueError("Bar is older than the latest bar of its asset")
+            if (timestamps > np.maximum(self.last_timestamp[rows], time.time()) + self.interval).any():
+                raise ValueError("Bar is more than one interval in the future")
+            append = timestamps > self.last_timestamp[rows]
+            positions = self.positions[rows].astype(int)
+            slots = np.where(append, positions, (positions - 1) % self.window)
+            # Appending drops the oldest close once the window is full
+            leaving = self.ring[rows, slots]
+            self.sums[rows] += closes - np.nan_to_num(leaving)
+            self.counts[rows] += append & np.isnan(leaving)
+            self.ring[rows, slots] = closes
+            self.positions[rows] = np.where(append, (positions + 1) % self.window, positions)
+            self.last_timestamp[rows] = timestamps
+            
+            # Re-sum once per lap so floating-point error cannot accumulate
+            wrapped = rows[append & (self.positions[rows] == 0)]
+            if len(wrapped):
+                self.sums[wrapped] = self.ring[wrapped].sum(axis=1)
+    
+    def values(self, symbols=None):
+        """
+        Latest close, SMA cost, growth valuation and ahr999 per asset
+        
+        Returns:
+            dict: symbol -> values (ahr999 and sma_cost are None until the window is full)
+        """
+        rows = np.arange(len(self.symbols)) if symbols is None else np.array([self.index[s] for s in symbols])
+        with self._lock:
+            return self._values(rows)
+    
+    def _values(self, rows):
+        counts = self.counts[rows]
+        has_bars = counts > 0
+        latest = self.ring[rows, (self.positions[rows].astype(int) - 1) % self.window]
+        sma = np.where(counts >= self.window, self.sums[rows] / np.maximum(counts, 1), np.nan)
+        timestamps = np.where(has_bars, self.last_timestamp[rows], 0)
+        growth = growth_valuation(timestamps)
+        index = latest / sma * latest / growth
+        
+        finite = lambda value: float(value) if np.isfinite(value) else None
+        result = {}
+        for i, row in enumerate(rows):
+            result[self.symbols[row]] = {
+                'timestamp': (datetime.fromtimestamp(timestamps[i], tz=timezone.utc).isoformat()
+                              if has_bars[i] else None),
+                'close': finite(latest[i]),
+                'sma_cost': finite(sma[i]),
+                'growth_valuation': finite(growth[i]) if has_bars[i] else None,
+                'ahr999': finite(index[i]),
+                'zone': ahr999_zone(index[i]),
+                'bars': int(counts[i]),
+            }
+        return result
 
 class BTCDataProcessor:
-    def __init__(self, csv_path='output/btc_raw_data.csv'):
+    def __init__(self, csv_path='output/btc_raw_data.csv', data=None):
+        """
+        Args:
+            csv_path (str): Raw price data, read only when data is not given
+            data (pd.DataFrame): Already loaded price data with a Date column
+        """
         self.csv_path = csv_path
-        self.data = self.load_data()
+        self.data = self.load_data() if data is None else data.copy()
         if self.data is not None:
             self.preprocess_data()
             self.calculate_ahr999_index()
@@ -45,7 +253,7 @@ class BTCDataProcessor:
         self.data['Bitcoin_Age'] = (self.data['Date'] - bitcoin_birthday).dt.days
         
         # Fill missing values
-        self.data.fillna(method='ffill', inplace=True)
+        self.data = self.data.ffill()
         print("Data preprocessing completed.")
 
     def calculate_exponential_growth(self):
@@ -55,7 +263,7 @@ class BTCDataProcessor:
 
     def calculate_200d_sma_cost(self):
         """Calculate the 200-day simple moving average (SMA) cost."""
-        self.data['200d_SMA_Cost'] = self.data['Close'].rolling(window=200).mean()
+        self.data['200d_SMA_Cost'] = self.data['Close'].rolling(window=SMA_WINDOW).mean()
 
     def calculate_ahr999_index(self):
         """Calculate the ahr999 index."""
@@ -70,8 +278,17 @@ class BTCDataProcessor:
                                     (self.data['Close'] / self.data['Exponential_Growth'])
         print("ahr999 index calculation completed.")
 
-    def plot_ahr999_index(self):
-        """Plot Bitcoin price and ahr999 index on the same graph with dual y-axis."""
+    def plot_ahr999_index(self, save_path=None):
+        """
+        Plot Bitcoin price and ahr999 index on the same graph with dual y-axis.
+        
+        Args:
+            save_path (str): Save the figure here instead of showing it in a
+                (blocking) window
+        """
+        import matplotlib.pyplot as plt
+        import matplotlib.dates as mdates  # For date formatting
+        
         if 'ahr999_Index' not in self.data.columns:
             print("ahr999 index not calculated. Please run calculate_ahr999_index() first.")
             return
@@ -79,8 +296,11 @@ class BTCDataProcessor:
         # Create a figure and primary axis
         fig, ax1 = plt.subplots(figsize=(14, 8))
         
+        # Keep about one point per pixel (min/max per bucket preserves peaks and troughs)
+        max_points = int(fig.get_figwidth() * fig.dpi)
+        
         # Plot Bitcoin price on the primary y-axis
-        ax1.plot(self.data['Date'], self.data['Close'], label='Bitcoin Price', color='red')
+        ax1.plot(*downsample(self.data['Date'], self.data['Close'], max_points), label='Bitcoin Price', color='red')
         ax1.set_xlabel('Date')
         ax1.set_ylabel('Bitcoin Price (USD)', color='red')
         ax1.tick_params(axis='y', labelcolor='red')
@@ -88,7 +308,8 @@ class BTCDataProcessor:
         
         # Create a secondary y-axis for the ahr999 index
         ax2 = ax1.twinx()
-        ax2.plot(self.data['Date'], self.data['ahr999_Index'], label='ahr999 Index', color='blue')
+        ax2.plot(*downsample(self.data['Date'], self.data['ahr999_Index'], max_points),
+                 label='ahr999 Index', color='blue')
         ax2.set_ylabel('ahr999 Index', color='blue')
         ax2.tick_params(axis='y', labelcolor='blue')
         
@@ -106,11 +327,21 @@ class BTCDataProcessor:
         # Title
         plt.title('Bitcoin Price and ahr999 Index')
         
-        # Show the plot
+        # Show or save the plot
         plt.tight_layout()
-        plt.show()
+        if save_path:
+            plt.savefig(save_path, dpi=300, bbox_inches='tight')
+            plt.close(fig)
+        else:
+            plt.show()
 
 # Example usage
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Plot the ahr999 index")
+    parser.add_argument('--save', default=None, help="Save the figure to this path instead of showing it")
+    args = parser.parse_args()
+    
     btc_processor = BTCDataProcessor(csv_path='output/btc_raw_data.csv')
-    btc_processor.plot_ahr999_index()
\ No newline at end of file
+    btc_processor.plot_ahr999_index(save_path=args.save)
\ No newline at end of file
@@ -1,12 +1,29 @@
 # api_service.py
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import pandas as pd
-import numpy as np
-from MLModel import BitcoinRiskModel
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 import uvicorn
-from typing import List, Dict
-from datetime import datetime
+import asyncio
+import copy
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from job_registry import JobRegistry
+from response_cache import TTLCache
+from risk_stream import RiskBroadcaster
+from service_metrics import MetricsRegistry, RequestTimer, RETRAIN_BUCKETS, current_timer
+from typing import List, Dict, Optional
+from datetime import datetime, timezone
+
+# pandas, sklearn and the model modules are imported lazily (during warm-up
+# or inside handlers), so health checks answer before the models load. numpy
+# is loaded at import by service_metrics (the metrics buffer pre-forked
+# workers share) and risk_stream; the ~0.5 s import is mostly FastAPI.
 
 app = FastAPI(
     title="Bitcoin Risk Analysis API",
@@ -14,23 +31,204 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Initialize the model
-model = BitcoinRiskModel()
-try:
-    model.load_models()
-    print("Models loaded successfully")
-except Exception as e:
-    print(f"Error loading models: {str(e)}")
-    print("Training new models...")
-    model.train_models()
+# Exit readiness with an error instead of training on boot when artifacts are missing
+FAIL_FAST = os.environ.get('BTC_RISK_FAIL_FAST', '0').lower() in ('1', 'true', 'yes')
+
+# Responses keyed by model version and request payload (the bar); cleared on model swap
+response_cache = TTLCache(maxsize=int(os.environ.get('BTC_RISK_CACHE_SIZE', 1024)),
+                          ttl=float(os.environ.get('BTC_RISK_CACHE_TTL', 60)))
+
+# Prometheus metrics; kept in one buffer that pre-forked workers share
+metrics = MetricsRegistry()
+TIMED_STAGES = ('parse', 'cache', 'features', 'scale', 'predict', 'score', 'serialize')
+TIMED_ROUTES = ('/predict/risk', '/predict/batch', '/api/v1/predict/risk', '/api/v1/predict/risk/bulk')
+STAGE_SECONDS = metrics.histogram(
+    'btc_risk_stage_seconds', "Time spent per request stage",
+    labels={'route': TIMED_ROUTES, 'stage': TIMED_STAGES})
+CACHE_LOOKUPS = metrics.counter(
+    'btc_risk_cache_lookups_total', "Response cache lookups",
+    labels={'cache': ('predict_risk', 'model_info', 'regime'), 'result': ('hit', 'miss')})
+RETRAIN_SECONDS = metrics.histogram(
+    'btc_risk_retrain_seconds', "Duration of retrain jobs",
+    labels={'incremental': ('false', 'true'), 'status': ('completed', 'failed')}, buckets=RETRAIN_BUCKETS)
+# Request latency and counts per route are registered once all routes exist (end of module)
+
+# Risk updates pushed to /stream/risk subscribers; the state is polled so bars
+# ingested by other pre-forked workers (shared feature state) are pushed too
+risk_stream = RiskBroadcaster(queue_size=int(os.environ.get('BTC_RISK_STREAM_QUEUE', 16)))
+STREAM_POLL_SECONDS = float(os.environ.get('BTC_RISK_STREAM_POLL', 0.5))
+_bar_ingested = None
+
+# Extra assets tracked by the ahr999 engine besides the model's own series
+AHR999_SYMBOLS = [s for s in os.environ.get('BTC_RISK_AHR999_SYMBOLS', '').split(',') if s.strip()]
+
+# Populated by the background warm-up
+model = None
+feature_state = None
+lending_analyzer = None
+ahr999_engine = None
+warmup = {'status': 'starting', 'stage': 'pending', 'error': None,
+          'started_at': time.time(), 'ready_at': None}
+
+def _warm_up():
+    """Import heavy modules, load (or train) the models and seed the feature state"""
+    global model, feature_state, lending_analyzer, ahr999_engine
+    try:
+        warmup['stage'] = 'importing'
+        import pandas as pd
+        from RiskMLModel import BitcoinRiskModel
+        from RiskAnalysis import LendingRiskAnalyzer
+        from feature_state import RollingFeatureState
+        from ahr999_index import AHR999Engine
+        
+        warmup['stage'] = 'loading models'
+        loaded = BitcoinRiskModel()
+        try:
+            loaded.load_models()
+            print("Models loaded successfully")
+        except Exception as e:
+            print(f"Error loading models: {str(e)}")
+            if FAIL_FAST:
+                raise
+            print("Training new models...")
+            warmup['stage'] = 'training models'
+            loaded.train_models()
+        loaded.version = 1
+        
+        # Rolling window of recent bars; posted bars are folded into it
+        feature_state = RollingFeatureState.from_frame(loaded.data)
+        # Builds the stacked forests now, so pre-forked workers share them
+        loaded.predict_matrix(feature_state.latest_features())
+        
+        # ahr999 per asset; extra assets start empty and fill from posted bars
+        closes = pd.DataFrame({DEFAULT_SYMBOL: loaded.data['Close']})
+        for symbol in AHR999_SYMBOLS:
+            closes[symbol.strip()] = float('nan')
+        ahr999_engine = AHR999Engine.from_history(closes)
+        
+        # Protocol parameters for loan-level scoring
+        warmup['stage'] = 'analyzing liquidation parameters'
+        lending_analyzer = LendingRiskAnalyzer()
+        lending_analyzer.analyze_liquidation_parameters()
+        model = loaded
+        warmup.update(status='ready', stage='ready', ready_at=time.time())
+    except Exception as e:
+        warmup.update(status='failed', stage='failed', error=str(e))
+        print(f"Warm-up failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_warm_up():
+    """Warm up in a background thread so the server starts accepting requests immediately"""
+    # Pre-forked workers inherit the models from the supervisor
+    if model is None:
+        threading.Thread(target=_warm_up, name='warm-up', daemon=True).start()
+
+@app.on_event("startup")
+async def start_stream_watcher():
+    """Start the task that turns ingested bars into stream updates"""
+    global _bar_ingested
+    _bar_ingested = asyncio.Event()
+    asyncio.create_task(_watch_bars())
+
+@app.on_event("shutdown")
+async def stop_retrain_worker():
+    """Stop the retrain worker process with the server (lets a running job finish)"""
+    if _retrain_executor is not None:
+        _retrain_executor.shutdown(wait=True, cancel_futures=True)
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request and records per-stage durations
+    
+    A plain ASGI middleware (no per-request task) so the overhead stays at
+    a few microseconds. Handlers time their stages on the RequestTimer
+    published through current_timer; whatever happens between the last
+    stage and the response start is recorded as serialization.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        timer = RequestTimer()
+        token = current_timer.set(timer)
+        status = [500]
+        
+        async def send_timed(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+                if timer.durations:
+                    timer.mark('serialize')
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            current_timer.reset(token)
+            route = scope.get('route')
+            _record_request(route.path if route is not None else 'other', status[0], timer)
+
+app.add_middleware(MetricsMiddleware)
+
+def _record_request(path, status, timer):
+    """Observe request latency and the stage timings of one request"""
+    elapsed = time.perf_counter() - timer.started
+    if path not in ROUTE_LABELS:
+        path = 'other'
+    REQUEST_SECONDS.observe(elapsed, path)
+    REQUESTS.inc(path, f"{status // 100}xx")
+    if path in TIMED_ROUTES:
+        for stage, seconds in timer.durations.items():
+            STAGE_SECONDS.observe(seconds, path, stage)
+
+def _cache_get(key):
+    """Response cache lookup that counts hits and misses per cache (first key element)"""
+    value = response_cache.get(key)
+    CACHE_LOOKUPS.inc(key[0], 'miss' if value is None else 'hit')
+    return value
+
+def _require_model():
+    """Current model, or 503 while warm-up is still running"""
+    current = model
+    if current is None:
+        raise HTTPException(status_code=503, detail=f"Service not ready ({warmup['stage']})")
+    return current
+
+# Symbol of the loaded history; batch bars without a symbol belong to it
+DEFAULT_SYMBOL = 'BTC-USD'
 
 class PriceData(BaseModel):
     timestamp: str
-    open: float
-    high: float
-    low: float
-    close: float
-    volume: float
+    open: float = Field(gt=0)
+    high: float = Field(gt=0)
+    low: float = Field(gt=0)
+    close: float = Field(gt=0)
+    volume: float = Field(ge=0)
+
+class BatchPriceData(PriceData):
+    symbol: Optional[str] = None
+
+class BatchPredictionRequest(BaseModel):
+    bars: List[BatchPriceData]
+
+class LoanRiskRequest(BaseModel):
+    timestamp: str
+    btc_price: float = Field(gt=0)
+    collateral: float = Field(gt=0)
+    loan_amount: float = Field(ge=0)
+
+class LoanRiskResponse(BaseModel):
+    timestamp: str
+    risk_level: str
+    stage: str
+    current_ltv: float
+    recommended_ltv: float
+    max_loan: float
+    margin_call_price: float
+    liquidation_price: float
+    warnings: List[str]
 
 class RiskPredictionResponse(BaseModel):
     timestamp: str
@@ -48,6 +246,33 @@ async def root():
         "status": "active"
     }
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up (fails only if warm-up failed)"""
+    if warmup['status'] == 'failed':
+        return JSONResponse({"status": "failed", "error": warmup['error']}, status_code=503)
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: models and feature state are loaded"""
+    body = {key: warmup[key] for key in ('status', 'stage', 'error')}
+    if model is None:
+        return JSONResponse(body, status_code=503)
+    body['model_version'] = model.version
+    body['warm_up_seconds'] = warmup['ready_at'] - warmup['started_at']
+    return body
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Request, stage, cache and retrain metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Response cache hit/miss counters"""
+    return response_cache.stats()
+
 @app.post("/predict/risk", response_model=RiskPredictionResponse)
 async def predict_risk(data: PriceData):
     """
@@ -59,86 +284,765 @@ async def predict_risk(data: PriceData):
     Returns:
         Risk predictions including risk level, price direction, and volatility
     """
+    timer = current_timer.get()
+    timer.mark('parse')
+    current = _require_model()
     try:
-        # Convert input data to DataFrame
-        df = pd.DataFrame([{
-            'Open': data.open,
-            'High': data.high,
-            'Low': data.low,
-            'Close': data.close,
-            'Volume': data.volume
-        }], index=[pd.to_datetime(data.timestamp)])
-        
-        # Create features
-        features_df = model.create_features()
-        
-        # Get predictions
-        predictions = model.predict(features_df.tail(1))
-        
-        # Get confidence scores
-        confidence_scores = {
-            'risk_level': float(model.classifiers['risk_level'].predict_proba(
-                model.scalers['risk_level'].transform(features_df.tail(1)[model.feature_columns])
-            ).max()),
-            'price_direction': float(model.classifiers['price_direction'].predict_proba(
-                model.scalers['price_direction'].transform(features_df.tail(1)[model.feature_columns])
-            ).max())
-        }
+        # Fold the bar into the rolling state; cost does not depend on history length.
+        # The ahr999 engine takes the same bar under the state's lock, so a bar
+        # either lands in both or in neither
+        with timer.stage('features'):
+            features = feature_state.update(
+                data.timestamp, data.close, data.volume,
+                on_accept=lambda ts, close: ahr999_engine.update([DEFAULT_SYMBOL], [ts], [close]))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    _bar_ingested.set()
+    
+    # The posted bar is now the latest one and earlier bars are fixed, so the
+    # prediction depends only on the model version and the payload
+    key = ('predict_risk', current.version, data.timestamp, data.open, data.high,
+           data.low, data.close, data.volume)
+    with timer.stage('cache'):
+        cached = _cache_get(key)
+    if cached is not None:
+        return cached
+    
+    try:
+        predictions = current.predict_matrix(features, timer)
         
-        return RiskPredictionResponse(
+        response = RiskPredictionResponse(
             timestamp=data.timestamp,
-            risk_level=predictions['risk_level'][0],
+            risk_level=str(predictions['risk_level'][0]),
             price_direction='Up' if predictions['price_direction'][0] == 1 else 'Down',
             predicted_volatility=float(predictions['volatility'][0]),
-            confidence_scores=confidence_scores
+            confidence_scores={
+                'risk_level': float(predictions['risk_level_confidence'][0]),
+                'price_direction': float(predictions['price_direction_confidence'][0])
+            }
         )
+        response_cache.set(key, response)
+        return response
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def build_batch_features(serving_model, symbols, timestamps, closes, volumes):
+    """
+    Feature matrix for a batch of bars in their original order
+    
+    Bars are grouped by symbol and time-ordered, then all series go through
+    one vectorized compute_feature_matrix call. Bars of DEFAULT_SYMBOL get
+    the preceding bars of the loaded history as context; other symbols need
+    MIN_HISTORY bars of their own before their rows are scored.
+    """
+    import numpy as np
+    from ahr999_index import to_datetime64
+    from feature_state import compute_feature_matrix, MIN_HISTORY
+    
+    order = np.lexsort((timestamps.asi8, symbols))
+    sorted_symbols = symbols[order]
+    starts = np.flatnonzero(np.r_[True, sorted_symbols[1:] != sorted_symbols[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+    
+    close_parts, volume_parts, time_parts, group_parts, keep_parts = [], [], [], [], []
+    for group, (start, end) in enumerate(zip(starts, ends)):
+        idx = order[start:end]
+        if sorted_symbols[start] == DEFAULT_SYMBOL:
+            pos = serving_model.data.index.searchsorted(timestamps[idx[0]])
+            context = serving_model.data.iloc[max(0, pos - (MIN_HISTORY - 1)):pos]
+            close_parts.append(context['Close'].to_numpy())
+            volume_parts.append(context['Volume'].to_numpy())
+            time_parts.append(to_datetime64(context.index))
+            group_parts.append(np.full(len(context), group))
+            keep_parts.append(np.zeros(len(context), dtype=bool))
+        close_parts.append(closes[idx])
+        volume_parts.append(volumes[idx])
+        time_parts.append(to_datetime64(timestamps[idx]))
+        group_parts.append(np.full(len(idx), group))
+        keep_parts.append(np.ones(len(idx), dtype=bool))
+    
+    features = compute_feature_matrix(np.concatenate(close_parts), np.concatenate(volume_parts),
+                                      np.concatenate(time_parts), np.concatenate(group_parts))
+    result = np.empty((len(order), features.shape[1]))
+    result[order] = features[np.concatenate(keep_parts)]
+    return result
+
+@app.post("/predict/batch")
+def predict_batch(request: BatchPredictionRequest, format: str = "columnar"):
+    """
+    Predict risk metrics for many bars, optionally across several symbols
+    
+    Features for all bars are built in one vectorized pass and each model
+    runs once over the whole matrix. Bars without enough history return
+    nulls.
+    
+    Args:
+        request: Bars with optional symbol (defaults to the loaded BTC history)
+        format: 'columnar' for one JSON object of arrays, 'ndjson' to stream
+            one JSON object per bar
+    
+    Returns:
+        Predictions in the order the bars were posted
+    """
+    timer = current_timer.get()
+    timer.mark('parse')
+    if format not in ('columnar', 'ndjson'):
+        raise HTTPException(status_code=422, detail="format must be 'columnar' or 'ndjson'")
+    import numpy as np
+    import pandas as pd
+    
+    # Hold one model reference so a concurrent hot-swap cannot mix versions
+    serving_model = _require_model()
+    bars = request.bars
+    if not bars:
+        raise HTTPException(status_code=422, detail="No bars provided")
+    
+    try:
+        with timer.stage('parse'):
+            symbols = np.array([bar.symbol or DEFAULT_SYMBOL for bar in bars])
+            timestamps = pd.to_datetime([bar.timestamp for bar in bars], utc=True, format='ISO8601')
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    try:
+        with timer.stage('features'):
+            closes = np.fromiter((bar.close for bar in bars), dtype=float, count=len(bars))
+            volumes = np.fromiter((bar.volume for bar in bars), dtype=float, count=len(bars))
+            features = build_batch_features(serving_model, symbols, timestamps, closes, volumes)
+        
+        valid = ~np.isnan(features).any(axis=1)
+        columns = {
+            'symbol': symbols.tolist(),
+            'timestamp': [bar.timestamp for bar in bars],
+        }
+        if valid.any():
+            predictions = serving_model.predict_matrix(features[valid], timer)
+            directions = np.where(predictions['price_direction'] == 1, 'Up', 'Down')
+            outputs = {
+                'risk_level': predictions['risk_level'].astype(str),
+                'risk_level_confidence': predictions['risk_level_confidence'],
+                'price_direction': directions,
+                'price_direction_confidence': predictions['price_direction_confidence'],
+                'predicted_volatility': predictions['volatility'],
+            }
+        else:
+            outputs = dict.fromkeys(['risk_level', 'risk_level_confidence', 'price_direction',
+                                     'price_direction_confidence', 'predicted_volatility'], [])
+        for name, values in outputs.items():
+            column = np.full(len(bars), None, dtype=object)
+            column[valid] = np.asarray(values).tolist()
+            columns[name] = column.tolist()
+        
+        if format == 'ndjson':
+            names = list(columns)
+            def rows():
+                for row in zip(*columns.values()):
+                    yield json.dumps(dict(zip(names, row))) + "\n"
+            return StreamingResponse(rows(), media_type="application/x-ndjson")
+        
+        with timer.stage('serialize'):
+            return JSONResponse({'count': len(bars), 'scored': int(valid.sum()), 'columns': columns})
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _stream_update(current):
+    """Risk update for the latest bar, encoded once as a server-sent event"""
+    import numpy as np
+    
+    snapshot = feature_state.snapshot()
+    predictions = current.predict_matrix(snapshot['features'])
+    update = {
+        'timestamp': datetime.fromtimestamp(snapshot['timestamp'], tz=timezone.utc).isoformat(),
+        'close': snapshot['close'],
+        'risk_level': str(predictions['risk_level'][0]),
+        'risk_level_confidence': float(predictions['risk_level_confidence'][0]),
+        'predicted_volatility': float(predictions['volatility'][0]),
+        'ahr999': snapshot['ahr999'] if np.isfinite(snapshot['ahr999']) else None,
+        'model_version': current.version,
+    }
+    return snapshot['revision'], f"id: {snapshot['revision']}\nevent: risk\ndata: {json.dumps(update)}\n\n"
+
+async def _watch_bars():
+    """Publish an update whenever the feature state changes and someone is listening"""
+    published = None
+    while True:
+        try:
+            await asyncio.wait_for(_bar_ingested.wait(), timeout=STREAM_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _bar_ingested.clear()
+        current = model
+        if current is None or not risk_stream.subscribers:
+            continue
+        state = (feature_state.revision, current.version)
+        if state == published:
+            continue
+        try:
+            revision, message = _stream_update(current)
+            risk_stream.publish(message)
+            published = (revision, current.version)
+        except Exception as e:
+            print(f"Stream update failed: {str(e)}")
+
+@app.get("/stream/risk")
+async def stream_risk(request: Request):
+    """
+    Server-sent events with the risk level, volatility forecast and ahr999
+    value of every newly ingested bar
+    
+    Each update is computed once and fanned out to all subscribers. A slow
+    client has its oldest pending updates dropped instead of slowing the
+    others down.
+    """
+    _require_model()
+    subscriber = risk_stream.subscribe()
+    _bar_ingested.set()
+    
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(subscriber.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            risk_stream.unsubscribe(subscriber)
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={'Cache-Control': 'no-cache'})
+
+@app.get("/stream/stats")
+async def stream_stats():
+    """Stream subscriber count and backlog"""
+    return risk_stream.stats()
+
+class AHR999Bar(BaseModel):
+    symbol: str
+    timestamp: str
+    close: float = Field(gt=0)
+
+class AHR999BarsRequest(BaseModel):
+    bars: List[AHR999Bar]
+
+def _require_ahr999():
+    """The ahr999 engine, or 503 while warming up"""
+    _require_model()
+    return ahr999_engine
+
+@app.get("/ahr999")
+async def ahr999_all():
+    """Latest ahr999 index, SMA cost and zone of every tracked asset"""
+    return _require_ahr999().values()
+
+@app.get("/ahr999/{symbol}")
+async def ahr999_asset(symbol: str):
+    """Latest ahr999 index of one asset"""
+    engine = _require_ahr999()
+    if symbol not in engine.index:
+        raise HTTPException(status_code=404, detail=f"Unknown asset: {symbol}")
+    return engine.values([symbol])[symbol]
+
+@app.post("/ahr999/bars")
+async def ahr999_bars(request: AHR999BarsRequest):
+    """
+    Fold bars of any tracked assets into the ahr999 engine
+    
+    Bars are applied in rounds holding at most one bar per asset, each round
+    as one vectorized update, so posting the latest bar of many assets
+    costs about as much as posting one. Bars of an asset must be in time
+    order.
+    
+    Returns:
+        Updated values of the assets that received bars
+    """
+    engine = _require_ahr999()
+    rounds = []
+    seen = {}
+    try:
+        for bar in request.bars:
+            k = seen.get(bar.symbol, 0)
+            seen[bar.symbol] = k + 1
+            if k == len(rounds):
+                rounds.append(([], [], []))
+            symbols, timestamps, closes = rounds[k]
+            symbols.append(bar.symbol)
+            timestamps.append(feature_state.to_epoch(bar.timestamp))
+            closes.append(bar.close)
+        for symbols, timestamps, closes in rounds:
+            engine.update(symbols, timestamps, closes)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return engine.values(list(seen))
+
+def _current_regime(current):
+    """Risk level predicted for the latest bar in the feature state (cached per bar)"""
+    key = ('regime', current.version, feature_state.last_timestamp, float(feature_state.closes[-1]))
+    timer = current_timer.get()
+    with timer.stage('cache'):
+        regime = _cache_get(key)
+    if regime is None:
+        with timer.stage('features'):
+            features = feature_state.latest_features()
+        regime = str(current.predict_matrix(features, timer)['risk_level'][0])
+        response_cache.set(key, regime)
+    return regime
+
+def _loan_warnings(scores, regime, i=0):
+    """Human-readable warnings for one scored loan"""
+    analyzer = lending_analyzer
+    ltv = scores['current_ltv'][i]
+    stage = scores['stage'][i]
+    warnings = []
+    if stage == 'liquidation':
+        warnings.append(f"LTV {ltv:.1%} is above the {analyzer.LIQUIDATION_LTV:.0%} liquidation threshold: "
+                        "position will be liquidated")
+    elif stage == 'margin_call':
+        warnings.append(f"LTV {ltv:.1%} is above the {analyzer.MARGIN_CALL_LTV:.0%} margin call threshold: "
+                        "add collateral or repay within 5 days")
+    elif stage == 'warning':
+        warnings.append(f"LTV {ltv:.1%} is above the {analyzer.WARNING_LTV:.0%} warning threshold")
+    if ltv > scores['recommended_ltv'][i]:
+        warnings.append(f"LTV {ltv:.1%} exceeds the recommended {scores['recommended_ltv'][i]:.1%} "
+                        f"for the current {regime.lower()} volatility regime")
+    if scores['below_min_collateral'][i]:
+        warnings.append(f"Collateral is below the {analyzer.MIN_COLLATERAL_BTC} BTC minimum")
+    return warnings
+
+@app.post("/api/v1/predict/risk", response_model=LoanRiskResponse)
+async def predict_loan_risk(data: LoanRiskRequest):
+    """
+    Score a single loan against the current regime and liquidation stages
+    
+    Args:
+        data: BTC price, BTC collateral and outstanding loan amount
+    
+    Returns:
+        Regime, liquidation stage, recommended LTV, trigger prices and warnings
+    """
+    timer = current_timer.get()
+    timer.mark('parse')
+    current = _require_model()
+    regime = _current_regime(current)
+    with timer.stage('score'):
+        scores = lending_analyzer.score_loans(data.btc_price, [data.collateral], [data.loan_amount], regime)
+    return LoanRiskResponse(
+        timestamp=data.timestamp,
+        risk_level=regime.lower(),
+        stage=str(scores['stage'][0]),
+        current_ltv=float(scores['current_ltv'][0]),
+        recommended_ltv=float(scores['recommended_ltv'][0]),
+        max_loan=float(scores['max_loan'][0]),
+        margin_call_price=float(scores['margin_call_price'][0]),
+        liquidation_price=float(scores['liquidation_price'][0]),
+        warnings=_loan_warnings(scores, regime)
+    )
+
+@app.post("/api/v1/predict/risk/bulk")
+async def predict_loan_book(request: Request, btc_price: Optional[float] = None):
+    """
+    Score a whole loan book in one vectorized pass
+    
+    The body is either CSV (Content-Type: text/csv) with columns
+    collateral, loan_amount and optional loan_id, or JSON of the form
+    {"btc_price": ..., "loans": {"loan_id": [...], "collateral": [...],
+    "loan_amount": [...]}}. btc_price defaults to the latest close.
+    
+    Returns:
+        Stage counts and columnar per-loan scores
+    """
+    from starlette.concurrency import run_in_threadpool
+    
+    current = _require_model()
+    body = await request.body()
+    current_timer.get().mark('parse')
+    # Parsing and scoring a large book is CPU-bound; keep it off the event loop
+    return await run_in_threadpool(_score_loan_book, current, body,
+                                   request.headers.get('content-type', ''), btc_price)
+
+def _score_loan_book(current, body, content_type, btc_price):
+    """Parse and score a loan book body (runs in the threadpool)"""
+    import io
+    import numpy as np
+    import pandas as pd
+    
+    timer = current_timer.get()
+    try:
+        with timer.stage('parse'):
+            if content_type.startswith('text/csv'):
+                book = pd.read_csv(io.BytesIO(body))
+            else:
+                payload = json.loads(body)
+                btc_price = payload.get('btc_price', btc_price)
+                book = pd.DataFrame(payload['loans'])
+            collateral = book['collateral'].to_numpy(dtype=float)
+            loan_amount = book['loan_amount'].to_numpy(dtype=float)
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid loan book: {str(e)}")
+    
+    btc_price = float(btc_price) if btc_price is not None else float(feature_state.closes[-1])
+    regime = _current_regime(current)
+    with timer.stage('score'):
+        scores = lending_analyzer.score_loans(btc_price, collateral, loan_amount, regime)
+    
+    stages, counts = np.unique(scores['stage'], return_counts=True)
+    columns = {'loan_id': book['loan_id'].tolist() if 'loan_id' in book else list(range(len(book)))}
+    for name in ('current_ltv', 'stage', 'max_loan', 'margin_call_price', 'liquidation_price',
+                 'below_min_collateral'):
+        values = scores[name]
+        if values.dtype.kind == 'f':
+            # JSON has no infinity (zero collateral)
+            values = np.where(np.isfinite(values), values, None)
+        columns[name] = values.tolist()
+    
+    return JSONResponse({
+        'risk_level': regime.lower(),
+        'btc_price': btc_price,
+        'recommended_ltv': float(scores['recommended_ltv'][0]) if len(book) else None,
+        'count': len(book),
+        'stage_counts': {str(stage): int(count) for stage, count in zip(stages, counts)},
+        'columns': columns
+    })
+
 @app.get("/model/info")
 async def model_info():
     """Get information about the trained models"""
+    import pandas as pd
+    current = _require_model()
+    key = ('model_info', current.version)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
     try:
         # Get feature importances
         risk_importance = pd.DataFrame({
-            'feature': model.feature_columns,
-            'importance': model.classifiers['risk_level'].feature_importances_
+            'feature': current.feature_columns,
+            'importance': current.classifiers['risk_level'].feature_importances_
         }).sort_values('importance', ascending=False)
         
-        return {
+        info = {
             "models": {
                 "risk_level": {
-                    "type": str(type(model.classifiers['risk_level']).__name__),
-                    "n_features": len(model.feature_columns),
+                    "type": str(type(current.classifiers['risk_level']).__name__),
+                    "n_features": len(current.feature_columns),
                     "feature_importance": risk_importance.to_dict(orient='records')
                 },
                 "price_direction": {
-                    "type": str(type(model.classifiers['price_direction']).__name__),
-                    "n_features": len(model.feature_columns)
+                    "type": str(type(current.classifiers['price_direction']).__name__),
+                    "n_features": len(current.feature_columns)
                 },
                 "volatility": {
-                    "type": str(type(model.regressors['volatility']).__name__),
-                    "n_features": len(model.feature_columns)
+                    "type": str(type(current.regressors['volatility']).__name__),
+                    "n_features": len(current.feature_columns)
                 }
             },
-            "features": model.feature_columns
+            "features": current.feature_columns,
+            "model_version": current.version
         }
+        response_cache.set(key, info)
+        return info
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/model/retrain")
-async def retrain_model():
-    """Retrain the models with latest data"""
+# Background retraining: one worker process, progress reported through a
+# queue; job records are shared between pre-forked workers
+retrain_jobs = JobRegistry()
+_retrain_executor = None
+_progress_queue = None
+_retrain_tasks = set()
+
+def _init_retrain_worker(queue):
+    """Give the worker process the shared progress queue"""
+    global _progress_queue
+    _progress_queue = queue
+    # Forked from a server process: drop the inherited uvicorn signal handlers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+def _run_retrain(job_id, csv_path, incremental, new_data=None):
+    """
+    Train a fresh model set in the worker process
+    
+    Args:
+        new_data (pd.DataFrame): Ingested bars the stored history lacks,
+            folded into an incremental update
+    
+    Returns:
+        dict: trained model attributes and the update result
+    """
+    from RiskMLModel import BitcoinRiskModel
+    
+    def progress(stage, fraction):
+        _progress_queue.put((job_id, stage, fraction))
+    
+    worker_model = BitcoinRiskModel(csv_path)
+    if incremental:
+        worker_model.load_models()
+        result = worker_model.update_models(new_data=new_data, progress=progress)
+    else:
+        worker_model.train_models(progress=progress)
+        result = {'mode': 'full'}
+    progress('done', 1.0)
+    return {
+        'attributes': {
+            'data': worker_model.data,
+            'classifiers': worker_model.classifiers,
+            'regressors': worker_model.regressors,
+            'scalers': worker_model.scalers,
+            'params': worker_model.params,
+            'update_state': worker_model.update_state,
+        },
+        'result': result,
+    }
+
+def _drain_progress():
+    """Apply progress messages from the worker to the job records"""
+    while _progress_queue is not None and not _progress_queue.empty():
+        job_id, stage, fraction = _progress_queue.get_nowait()
+        retrain_jobs.update(job_id, stage=stage, progress=fraction)
+
+def _swap_models(trained):
+    """
+    Atomically publish a newly trained model set
+    
+    The new set goes onto a copy of the current model and the module
+    global is rebound in one assignment, so requests that already hold the
+    old model finish on a consistent version.
+    """
+    global model
+    new_model = copy.copy(model)
+    for name, value in trained['attributes'].items():
+        setattr(new_model, name, value)
+    new_model.version = model.version + 1
+    model = new_model
+    response_cache.clear()
+
+async def _watch_retrain(job_id, future):
+    """
+    Wait for a retrain job, then publish its models
+    
+    Progress is drained here while the job runs, so the shared records stay
+    current whichever worker serves the status requests. Pre-forked
+    workers keep serving the current models until the supervisor has
+    reloaded the saved ones and replaced every worker; a single server
+    swaps them in directly.
+    """
+    reload = False
     try:
-        model.train_models()
-        return {"message": "Models retrained successfully"}
+        while not future.done():
+            await asyncio.wait({future}, timeout=0.5)
+            _drain_progress()
+        trained = future.result()
+        _drain_progress()
+        version = model.version
+        if trained['result'].get('mode') != 'none':
+            if _supervisor_pid:
+                reload = True
+                version += 1
+            else:
+                _swap_models(trained)
+                version = model.version
+        retrain_jobs.update(job_id, status='completed', result=trained['result'], model_version=version)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        retrain_jobs.update(job_id, status='failed', error=str(e))
+    job = retrain_jobs.get(job_id)
+    finished_at = time.time()
+    duration = finished_at - job['started_at']
+    retrain_jobs.update(job_id, finished_at=finished_at, duration=duration)
+    RETRAIN_SECONDS.observe(duration, str(job['incremental']).lower(), job['status'])
+    if reload:
+        # The supervisor replaces this worker too, so the record is final by now
+        os.kill(_supervisor_pid, signal.SIGHUP)
+
+@app.post("/model/retrain", status_code=202)
+async def retrain_model(incremental: bool = False):
+    """
+    Start retraining the models with latest data in a background process
+    
+    Training runs in a worker process so the event loop keeps serving
+    requests; the finished model set is swapped in atomically. Only one
+    job runs at a time across all pre-forked workers.
+    
+    Args:
+        incremental: Update the models with bars added since the last training
+            instead of a full retrain (falls back to a full retrain on drift).
+            Besides the stored history this includes the bars posted to
+            /predict/risk that are still in the rolling window (the latest
+            200); older ingested bars are only seen once they are stored.
+    
+    Returns:
+        The job record; poll GET /model/retrain/{job_id} for progress
+    """
+    global _retrain_executor, _progress_queue
+    _require_model()
+    if _retrain_executor is None:
+        _progress_queue = multiprocessing.Queue()
+        _retrain_executor = ProcessPoolExecutor(max_workers=1, initializer=_init_retrain_worker,
+                                                initargs=(_progress_queue,))
+    
+    job_id = uuid.uuid4().hex[:12]
+    running = retrain_jobs.start({
+        'job_id': job_id,
+        'incremental': incremental,
+        'stage': 'queued',
+        'progress': 0.0,
+        'started_at': time.time(),
+    })
+    if running is not None:
+        raise HTTPException(status_code=409, detail=f"Retrain job {running['job_id']} is already running")
+    
+    # Ingested bars live only in the shared feature state, not in the store
+    new_data = feature_state.bars_since(model.data.index[-1].timestamp()) if incremental else None
+    future = asyncio.get_running_loop().run_in_executor(
+        _retrain_executor, _run_retrain, job_id, 'output/btc_raw_data.csv', incremental, new_data)
+    task = asyncio.create_task(_watch_retrain(job_id, future))
+    _retrain_tasks.add(task)
+    task.add_done_callback(_retrain_tasks.discard)
+    return retrain_jobs.get(job_id)
+
+@app.get("/model/retrain")
+async def list_retrain_jobs():
+    """List retrain jobs, most recent first"""
+    _drain_progress()
+    return {"model_version": model.version if model else None, "jobs": retrain_jobs.list()}
+
+@app.get("/model/retrain/{job_id}")
+async def retrain_status(job_id: str):
+    """Get status and progress of a retrain job"""
+    _drain_progress()
+    job = retrain_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown retrain job {job_id}")
+    return job
+
+# Set in pre-forked workers: pid of the supervising process
+_supervisor_pid = None
+
+def _reload_models():
+    """Load the saved model set in the supervisor as the next model version"""
+    global model
+    from RiskMLModel import BitcoinRiskModel
+    
+    reloaded = BitcoinRiskModel()
+    reloaded.load_models()
+    reloaded.predict_matrix(feature_state.latest_features())
+    reloaded.version = model.version + 1
+    model = reloaded
+    print(f"Supervisor reloaded models (version {model.version})")
+
+def start_production(workers=4, host="0.0.0.0", port=8000):
+    """
+    Serve with pre-forked workers that share one copy of the models
+    
+    The supervisor loads the models and history once, moves the rolling
+    feature state into shared memory and then forks the uvicorn workers
+    over a shared listening socket. Model arrays are shared copy-on-write
+    (gc.freeze keeps the collector from touching them), so memory stays
+    flat as workers are added. Retrain job records live in shared memory
+    too. SIGHUP reloads the saved models in the supervisor and replaces all
+    workers at once, so they never serve different model versions; a
+    finished retrain job in any worker sends it. Requires a platform with
+    os.fork.
+    """
+    import gc
+    import socket
+    
+    _warm_up()
+    if model is None:
+        raise SystemExit(f"Warm-up failed: {warmup['error']}")
+    feature_state.share()
+    ahr999_engine.share()
+    metrics.share()
+    retrain_jobs.share()
+    
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    
+    def spawn():
+        gc.collect()
+        gc.freeze()
+        pid = os.fork()
+        if pid == 0:
+            global _supervisor_pid
+            _supervisor_pid = os.getppid()
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            uvicorn.Server(uvicorn.Config(app, log_level="info")).run(sockets=[sock])
+            os._exit(0)
+        return pid
+    
+    pending = []
+    signal.signal(signal.SIGHUP, lambda *_: pending.append('reload'))
+    signal.signal(signal.SIGTERM, lambda *_: pending.append('stop'))
+    signal.signal(signal.SIGINT, lambda *_: pending.append('stop'))
+    
+    pids = {spawn() for _ in range(workers)}
+    print(f"Serving on {host}:{port} with {workers} pre-forked workers (supervisor {os.getpid()})")
+    
+    while True:
+        time.sleep(0.5)
+        if 'stop' in pending:
+            for pid in pids:
+                os.kill(pid, signal.SIGTERM)
+            for pid in pids:
+                os.waitpid(pid, 0)
+            break
+        
+        # Replace workers that exited unexpectedly
+        for pid in list(pids):
+            if os.waitpid(pid, os.WNOHANG)[0]:
+                pids.discard(pid)
+                pids.add(spawn())
+        
+        if 'reload' in pending:
+            pending.remove('reload')
+            try:
+                gc.unfreeze()
+                _reload_models()
+            except Exception as e:
+                print(f"Reload failed, keeping current workers: {str(e)}")
+                continue
+            # Stop every old worker before forking the replacements, so two
+            # model versions are never served side by side; connections that
+            # arrive in between wait in the listen backlog
+            old_pids = pids
+            for old in old_pids:
+                os.kill(old, signal.SIGTERM)
+            pids = {spawn() for _ in range(workers)}
+            for old in old_pids:
+                os.waitpid(old, 0)
+    
+    sock.close()
+
+# Every registered route gets its own latency series; anything else is 'other'
+ROUTE_LABELS = tuple(route.path for route in app.routes) + ('other',)
+REQUEST_SECONDS = metrics.histogram(
+    'btc_risk_request_seconds', "HTTP request latency", labels={'route': ROUTE_LABELS})
+REQUESTS = metrics.counter(
+    'btc_risk_requests_total', "HTTP requests by status class",
+    labels={'route': ROUTE_LABELS, 'status': ('1xx', '2xx', '3xx', '4xx', '5xx')})
 
 def start():
     """Start the API server"""
     uvicorn.run("api_service:app", host="0.0.0.0", port=8000, reload=True)
 
+def main(argv=None):
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Bitcoin Risk Analysis API")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Pre-forked production workers sharing one model copy (0 = dev server with reload)")
+    parser.add_argument('--host', default="0.0.0.0")
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+    
+    if args.workers:
+        start_production(args.workers, args.host, args.port)
+    else:
+        start()
+
 if __name__ == "__main__":
-    start()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,297 @@
+# benchmark.py
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+# The components under test are imported by the setup functions, so only
+# the benchmarks that run load sklearn, scipy or matplotlib
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+
+# Rows per day of the synthetic minute bars
+BARS_PER_DAY = 1440
+
+def synthetic_ohlcv(n_rows, seed=0):
+    """
+    Minute OHLCV bars following a geometric random walk
+
+    Per-bar volatility is scaled so a day of bars has about the 3% daily
+    volatility of BTC; the derived metrics of the stored CSV are added with
+    DataPrep.derive_metrics.
+
+    Returns:
+        pd.DataFrame: UTC Date-indexed bars in the layout of btc_raw_data.csv
+    """
+    from DataPrep import derive_metrics
+
+    rng = np.random.default_rng(seed)
+    log_returns = rng.normal(0, 0.03 / np.sqrt(BARS_PER_DAY), n_rows)
+    close = 20000 * np.exp(np.cumsum(log_returns))
+    open_price = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.0005, n_rows))
+    index = pd.date_range('2015-01-01', periods=n_rows, freq='min', tz='UTC', name='Date')
+    df = pd.DataFrame({
+        'Open': open_price,
+        'High': np.maximum(open_price, close) * (1 + spread),
+        'Low': np.minimum(open_price, close) * (1 - spread),
+        'Close': close,
+        'Volume': rng.lognormal(17, 0.5, n_rows),
+    }, index=index)
+    return derive_metrics(df)
+
+STRESS_SCENARIOS = [
+    {'name': 'Major Crash', 'price_shock': -0.40, 'volatility_shock': 2.0},
+    {'name': 'Moderate Correction', 'price_shock': -0.20, 'volatility_shock': 1.5},
+    {'name': 'Bull Run', 'price_shock': 0.30, 'volatility_shock': 1.0},
+]
+
+# Model shared by the predict benchmarks, trained once on a small set
+_predict_model = None
+
+def _setup_derive_metrics(df):
+    from DataPrep import derive_metrics
+    bars = df[['Open', 'High', 'Low', 'Close', 'Volume']].copy()
+    return lambda: derive_metrics(bars)
+
+def _setup_create_features(df):
+    from RiskMLModel import BitcoinRiskModel
+    return BitcoinRiskModel(data=df).create_features
+
+def _setup_train_models(df):
+    from RiskMLModel import BitcoinRiskModel
+    return BitcoinRiskModel(data=df).train_models
+
+def _setup_predict(df):
+    global _predict_model
+    from RiskMLModel import BitcoinRiskModel
+    if _predict_model is None:
+        _predict_model = BitcoinRiskModel(data=synthetic_ohlcv(20_000, seed=1))
+        _predict_model.train_models()
+    features = _predict_model.create_features(data=df)
+    return lambda: _predict_model.predict(features)
+
+def _setup_liquidation_parameters(df):
+    from RiskAnalysis import LendingRiskAnalyzer
+    return LendingRiskAnalyzer(data=df).analyze_liquidation_parameters
+
+def _setup_repayment_windows(df):
+    from RiskAnalysis import LendingRiskAnalyzer
+    return LendingRiskAnalyzer(data=df).analyze_repayment_windows
+
+def _crypto_model(df):
+    from Modeling import CryptoRiskManagementModel
+    model = CryptoRiskManagementModel()
+    model.historical_data = pd.DataFrame({'price': df['Close'], 'volume': df['Volume'],
+                                          'returns': df['Returns']})
+    return model
+
+def _setup_backtest(df):
+    model = _crypto_model(df)
+    return lambda: model.backtest_strategy(1_000_000, 0.5, df.index[0], df.index[-1])
+
+def _setup_stress_test(df):
+    import scipy.stats  # imported lazily by the model; keep it out of the traced run
+    model = _crypto_model(df)
+    return lambda: model.stress_test_crypto(1_000_000, STRESS_SCENARIOS)
+
+def _setup_ahr999(df):
+    from ahr999_index import compute_ahr999
+    return lambda: compute_ahr999(df['Close'])
+
+def _setup_render_figures(df):
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+    import matplotlib.pyplot
+    import scipy.stats
+    from RiskVisualization import RiskVisualizer
+    visualizer = RiskVisualizer(data=df, dpi=100)
+    return lambda: visualizer.generate_all_plots(force=True)
+
+# name -> (setup returning the timed callable, largest row count run by default)
+BENCHMARKS = {
+    'derive_metrics': (_setup_derive_metrics, None),
+    'create_features': (_setup_create_features, 1_000_000),
+    'train_models': (_setup_train_models, 100_000),
+    'predict': (_setup_predict, 1_000_000),
+    'analyze_liquidation_parameters': (_setup_liquidation_parameters, None),
+    'analyze_repayment_windows': (_setup_repayment_windows, 1_000_000),
+    'backtest_strategy': (_setup_backtest, 100_000),
+    'stress_test_crypto': (_setup_stress_test, None),
+    'ahr999': (_setup_ahr999, None),
+    'render_figures': (_setup_render_figures, 1_000_000),
+}
+
+def measure(run, repeat, max_seconds, memory=True):
+    """
+    Time a callable and record its peak traced memory
+
+    The first call runs under tracemalloc (numpy and pandas buffers are
+    traced) and doubles as the warm-up; up to repeat untraced calls follow,
+    stopping early once max_seconds have been spent.
+
+    Returns:
+        dict: median and minimum seconds, timed runs and peak MB
+    """
+    result = {}
+    if memory:
+        tracemalloc.start()
+        run()
+        result['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    times = []
+    start = time.perf_counter()
+    while len(times) < repeat and (not times or time.perf_counter() - start < max_seconds):
+        t = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t)
+    result.update(seconds=float(np.median(times)), min_seconds=min(times), runs=len(times))
+    return result
+
+def scaling_exponent(sizes, seconds):
+    """Slope of log(time) against log(rows): ~1 is linear, ~2 quadratic"""
+    if len(sizes) < 2:
+        return None
+    return float(np.polyfit(np.log(sizes), np.log(seconds), 1)[0])
+
+def run_benchmarks(names, sizes, repeat=3, max_seconds=30, memory=True, limits=True):
+    """
+    Run the selected benchmarks on synthetic datasets of each size
+
+    Components write their files (models, figures, reports) into a
+    scratch directory, so the real outputs are left alone.
+
+    Returns:
+        dict: benchmark name -> rows -> measurement, plus the scaling exponent
+    """
+    results = {name: {'sizes': {}} for name in names}
+    scratch = tempfile.mkdtemp(prefix='btc-bench-')
+    cwd = os.getcwd()
+    os.chdir(scratch)
+    try:
+        for n in sizes:
+            df = synthetic_ohlcv(n)
+            print(f"\n{n:,} rows")
+            for name in names:
+                setup, max_rows = BENCHMARKS[name]
+                if limits and max_rows is not None and n > max_rows:
+                    results[name]['sizes'][str(n)] = {'skipped': f"above {max_rows:,} rows"}
+                    print(f"  {name:32s} skipped (above {max_rows:,} rows, see --no-limits)")
+                    continue
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        r = measure(setup(df), repeat, max_seconds, memory)
+                except Exception as e:
+                    results[name]['sizes'][str(n)] = {'error': str(e)}
+                    print(f"  {name:32s} failed: {str(e)}")
+                    continue
+                r['rows_per_second'] = n / r['seconds']
+                results[name]['sizes'][str(n)] = r
+                print(f"  {name:32s} {r['seconds']:10.4f}s  {r['rows_per_second']:14,.0f} rows/s"
+                      + (f"  peak {r['peak_mb']:9.1f} MB" if 'peak_mb' in r else ""))
+            del df
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    for name, result in results.items():
+        measured = [(int(n), r['seconds']) for n, r in result['sizes'].items() if 'seconds' in r]
+        result['scaling'] = scaling_exponent(*zip(*measured)) if measured else None
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, max_regression):
+    """
+    Print time and memory changes against a baseline run
+
+    Returns:
+        list: (benchmark, rows) pairs whose time or peak memory grew by more
+        than max_regression
+    """
+    regressions = []
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for name, result in results['benchmarks'].items():
+        base_sizes = baseline['benchmarks'].get(name, {}).get('sizes', {})
+        for n, r in result['sizes'].items():
+            base = base_sizes.get(n)
+            if base is None or 'seconds' not in base or 'seconds' not in r:
+                continue
+            change = r['seconds'] / base['seconds'] - 1
+            line = f"{name:32s} {int(n):>10,}  {base['seconds']:9.4f} -> {r['seconds']:9.4f}s ({change:+.1%})"
+            regressed = change > max_regression
+            if 'peak_mb' in r and base.get('peak_mb'):
+                memory_change = r['peak_mb'] / base['peak_mb'] - 1
+                line += f"  peak {base['peak_mb']:.1f} -> {r['peak_mb']:.1f} MB ({memory_change:+.1%})"
+                regressed = regressed or memory_change > max_regression
+            print(line + ("  REGRESSION" if regressed else ""))
+            if regressed:
+                regressions.append((name, int(n)))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths on synthetic data of growing size")
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help="Dataset sizes in rows")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per benchmark and size")
+    parser.add_argument('--max-seconds', type=float, default=30,
+                        help="Stop repeating a benchmark once this much time has been spent on it")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the traced peak-memory run")
+    parser.add_argument('--no-limits', action='store_true',
+                        help="Run slow benchmarks above their default row limits too")
+    parser.add_argument('--output', default=None, help="Results file (default: output/benchmarks/<time>.json)")
+    parser.add_argument('--compare', help="Baseline results file to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="Fail when time or peak memory grows by more than this fraction of the baseline")
+    args = parser.parse_args(argv)
+
+    now = datetime.now(timezone.utc)
+    output = os.path.abspath(args.output or os.path.join('output', 'benchmarks', f"{now:%Y%m%dT%H%M%S}.json"))
+    benchmarks = run_benchmarks(args.benchmarks, sorted(args.sizes), args.repeat, args.max_seconds,
+                                memory=not args.no_memory, limits=not args.no_limits)
+
+    print("\nScaling exponents (time ~ rows^k):")
+    for name, result in benchmarks.items():
+        if result['scaling'] is not None:
+            print(f"  {name:32s} {result['scaling']:5.2f}")
+
+    results = {
+        'timestamp': now.isoformat(),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'cpus': os.cpu_count(),
+        'repeat': args.repeat,
+        'benchmarks': benchmarks,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print(f"Regressions in: {', '.join(f'{name} ({n:,} rows)' for name, n in regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# cli.py
+import argparse
+import importlib
+import os
+import sys
+
+# Subcommands import pandas, sklearn, matplotlib or yfinance only when they
+# run, so `--help` and light commands start without loading them
+
+DATA_PATH = 'output/btc_raw_data.csv'
+
+def fetch(args):
+    """Download the price history and write the data report"""
+    from DataPrep import BitcoinDataLoader
+
+    loader = BitcoinDataLoader(args.symbol)
+    if loader.fetch_data(period=args.period, interval=args.interval) is None:
+        sys.exit(1)
+    loader.save_data_and_report()
+
+def train(args):
+    """Train (or incrementally update) and save the risk models"""
+    from RiskMLModel import BitcoinRiskModel
+
+    model = BitcoinRiskModel(args.data_path)
+    if args.incremental:
+        model.load_models()
+        model.update_models()
+        return
+    if args.tune:
+        model.tune_hyperparameters(budget_seconds=args.tune_budget)
+    model.train_models()
+
+def predict(args):
+    """Score bars with the saved models"""
+    import pandas as pd
+    from DataPrep import load_market_data
+    from RiskMLModel import BitcoinRiskModel
+
+    model = BitcoinRiskModel(args.data_path)
+    model.load_models()
+    if args.input_data:
+        # New bars are scored with the stored history as indicator context
+        # Only the columns the models are built from; input bars may carry more.
+        # Loaded like the history, so naive dates are UTC like the stored ones
+        bars = load_market_data(args.input_data, model.DATA_COLUMNS, compact=False)
+        data = pd.concat([model.data[model.DATA_COLUMNS], bars])
+        data = data[~data.index.duplicated(keep='last')].sort_index()
+        features = model.create_features(data=data)
+        features = features[features.index.isin(bars.index)]
+    else:
+        features = model.create_features().tail(args.last)
+    if features.empty:
+        sys.exit("No bars with a complete feature history to score")
+
+    predictions = model.predict_matrix(features[model.feature_columns].to_numpy())
+    result = pd.DataFrame({
+        'close': features['Close'],
+        'risk_level': predictions['risk_level'],
+        'risk_level_confidence': predictions['risk_level_confidence'],
+        'price_direction': ['Up' if d == 1 else 'Down' for d in predictions['price_direction']],
+        'price_direction_confidence': predictions['price_direction_confidence'],
+        'predicted_volatility': predictions['volatility'],
+    }, index=features.index)
+    if args.output:
+        result.to_csv(args.output)
+        print(f"Predictions saved to {args.output}")
+    else:
+        print(result.to_string(float_format=lambda v: f"{v:.4f}"))
+
+def validate_compact(args):
+    """Report how far compact loading deviates from float64"""
+    from DataPrep import validate_compact as validate
+    validate(args.data_path, args.output)
+
+# Subcommands backed by a module's own main(argv); their arguments are
+# passed through, so e.g. `python cli.py plot --help` shows the module's options
+DELEGATED = {
+    'analyze': ('RiskAnalysis', "Derive lending protocol parameters"),
+    'plot': ('RiskVisualization', "Generate the risk analysis figures"),
+    'report': ('report_generator', "Generate the markdown risk report"),
+    'serve': ('api_service', "Run the prediction API"),
+    'pipeline': ('pipeline', "Run the cached end-to-end pipeline"),
+    'benchmark': ('benchmark', "Benchmark the hot paths on synthetic data"),
+    'simulate': ('market_simulator', "Generate synthetic market data"),
+    'cascade': ('liquidation_cascade', "Simulate a liquidation cascade on a loan book"),
+}
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Bitcoin risk analysis for Yala Protocol")
+    parser.add_argument('--profile', action='store_true',
+                        help="Record wall/CPU time, rows and memory per method and write a Chrome trace")
+    parser.add_argument('--profile-output', metavar='PATH',
+                        help="Trace file (default: output/profile/<time>.json)")
+    parser.add_argument('--compact', action='store_true',
+                        help="Load market data as float32 (Close stays float64) from a store with integer epoch dates")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='command')
+
+    p = commands.add_parser('fetch', help="Download the price history")
+    p.add_argument('--symbol', default='BTC-USD')
+    p.add_argument('--period', default='max', help="e.g. max, 1y, 5d")
+    p.add_argument('--interval', default='1d', help="e.g. 1d, 1h")
+    p.set_defaults(func=fetch)
+
+    _delegate(commands, 'analyze')
+
+    p = commands.add_parser('train', help="Train and save the risk models")
+    p.add_argument('--data-path', default=DATA_PATH)
+    p.add_argument('--tune', action='store_true', help="Run the hyperparameter search first")
+    p.add_argument('--tune-budget', type=float, default=600, help="Search budget in seconds")
+    p.add_argument('--incremental', action='store_true',
+                   help="Update the saved models with bars added since they were trained")
+    p.set_defaults(func=train)
+
+    p = commands.add_parser('predict', help="Score bars with the saved models")
+    p.add_argument('--data-path', default=DATA_PATH, help="History used as indicator context")
+    p.add_argument('--input-data', help="CSV of Date-indexed OHLCV bars to score (default: latest stored bars)")
+    p.add_argument('--last', type=int, default=1, help="Latest stored bars to score without --input-data")
+    p.add_argument('--output', help="Write predictions to this CSV instead of printing them")
+    p.set_defaults(func=predict)
+
+    p = commands.add_parser('validate-compact', help="Compare compact loading with float64 results")
+    p.add_argument('--data-path', default=DATA_PATH)
+    p.add_argument('--output', default='output/compact_validation.txt')
+    p.set_defaults(func=validate_compact)
+
+    for name in ('plot', 'report', 'serve', 'pipeline', 'benchmark', 'simulate', 'cascade'):
+        _delegate(commands, name)
+    return parser
+
+def _delegate(commands, name):
+    # No -h of its own: --help is passed through to the module's parser
+    commands.add_parser(name, help=DELEGATED[name][1], add_help=False)
+
+def main(argv=None):
+    parser = build_parser()
+    args, rest = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+    if args.profile or args.profile_output:
+        # Before the subcommand imports the instrumented modules
+        import profiling
+        profiling.enable(args.profile_output)
+    if args.compact:
+        # Read by the loaders, including those in pipeline and render workers
+        os.environ['BTC_RISK_COMPACT'] = '1'
+    if args.command in DELEGATED:
+        importlib.import_module(DELEGATED[args.command][0]).main(rest)
+        return
+    if rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+# conftest.py
+import os
+import shutil
+import pytest
+from risk_stream import RiskBroadcaster
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """api_service warmed up (models trained) in a scratch output directory, with a small stream queue"""
+    os.makedirs(tmp_path / 'output')
+    shutil.copy(os.path.join(REPO, 'output', 'btc_raw_data.csv'), tmp_path / 'output')
+    monkeypatch.chdir(tmp_path)
+    import api_service
+    monkeypatch.setattr(api_service, 'risk_stream', RiskBroadcaster(queue_size=4))
+    api_service._warm_up()
+    assert api_service.model is not None, api_service.warmup['error']
+    yield api_service
+    for name in ('model', 'feature_state', 'lending_analyzer', 'ahr999_engine'):
+        setattr(api_service, name, None)
@@ -0,0 +1,101 @@
+# downsampling.py
+import numpy as np
+
+def minmax_indices(y, n_out):
+    """
+    Positions of the minimum and maximum of each bucket
+
+    The series is cut into n_out // 2 equal-count buckets and the lowest
+    and highest point of each is kept (in time order), so every peak and
+    trough survives and a line drawn through the points covers the same
+    pixels as the full series.
+
+    Args:
+        y (np.ndarray): values without NaNs
+        n_out (int): maximum number of points to keep
+
+    Returns:
+        np.ndarray: sorted positions into y
+    """
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    size = -(-n // max(n_out // 2, 1))
+    buckets = -(-n // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    base = np.arange(buckets) * size
+    keep = np.concatenate([base + np.nanargmin(padded, axis=1), base + np.nanargmax(padded, axis=1), [0, n - 1]])
+    return np.unique(keep)
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets point selection
+
+    Keeps the first and last point and, from each of n_out - 2 buckets,
+    the point forming the largest triangle with the previously kept point
+    and the average of the next bucket. Preserves the visual shape with
+    fewer points than min/max, but extremes are not guaranteed.
+
+    Args:
+        x (np.ndarray): numeric x values (increasing)
+        y (np.ndarray): values without NaNs
+        n_out (int): number of points to keep
+
+    Returns:
+        np.ndarray: sorted positions into y
+    """
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    prev = 0
+    for b in range(n_out - 2):
+        start, end = edges[b], edges[b + 1]
+        next_start, next_end = end, edges[b + 2] if b + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[prev] - avg_x) * (y[start:end] - y[prev])
+                      - (x[prev] - x[start:end]) * (avg_y - y[prev]))
+        prev = start + int(area.argmax())
+        keep[b + 1] = prev
+    return keep
+
+def downsample(x, y, n_out, method='minmax'):
+    """
+    Reduce a series to about n_out points for plotting
+
+    NaN values are dropped first. Works on numpy arrays and pandas
+    objects (datetime x values included); the selected points are
+    returned with the input types.
+
+    Args:
+        x: x values (e.g. a DatetimeIndex or Date column)
+        y: y values
+        n_out (int): target number of points, typically the plot width in pixels
+        method (str): 'minmax' (keeps every peak and trough) or 'lttb'
+
+    Returns:
+        tuple: (x, y) of the kept points
+    """
+    values = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(~np.isnan(values))
+    if method == 'minmax':
+        keep = minmax_indices(values[valid], n_out)
+    elif method == 'lttb':
+        x_values = np.asarray(x)
+        if np.issubdtype(x_values.dtype, np.datetime64):
+            x_values = x_values.astype('datetime64[ns]').astype(np.int64)
+        elif not np.issubdtype(x_values.dtype, np.number):
+            # e.g. timezone-aware timestamps; positions stand in for evenly spaced bars
+            x_values = np.arange(len(values))
+        keep = lttb_indices(x_values[valid], values[valid], n_out)
+    else:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    positions = valid[keep]
+    take = lambda s: s.iloc[positions] if hasattr(s, 'iloc') else s[positions]
+    return take(x), take(y)
@@ -0,0 +1,299 @@
+# feature_state.py
+from datetime import datetime, timezone
+import mmap
+import multiprocessing
+import threading
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from ahr999_index import SMA_WINDOW, growth_valuation
+
+# Bars needed before the first row with a complete feature vector (the
+# ahr999 SMA cost window; the longest moving average feature is MA50)
+MIN_HISTORY = SMA_WINDOW
+MA_WINDOW = 50
+
+def compute_feature_matrix(closes, volumes, timestamps, group_ids=None):
+    """
+    Vectorized feature matrix for many bars at once
+
+    Computes the same features as BitcoinRiskModel.create_features() for
+    every bar in one pass over sliding-window views. Several series can be
+    stacked back to back with group_ids marking which series each bar
+    belongs to (rows must be time-ordered within a group); rows with fewer
+    than MIN_HISTORY bars of their own series behind them are NaN.
+
+    Args:
+        closes, volumes: Bar values
+        timestamps: Bar dates (DatetimeIndex, datetime64 or epoch seconds)
+        group_ids: Optional series id per bar
+
+    Returns:
+        np.ndarray: feature matrix of shape (n_bars, n_features)
+    """
+    c = np.asarray(closes, dtype=float)
+    v = np.asarray(volumes, dtype=float)
+    n = len(c)
+    out = np.full((n, 13), np.nan)
+    if n < MIN_HISTORY:
+        return out
+
+    def rolling(x, window, func, **kwargs):
+        res = np.full(n, np.nan)
+        res[window - 1:] = func(sliding_window_view(x, window), axis=1, **kwargs)
+        return res
+
+    r = np.full(n, np.nan)
+    r[1:] = c[1:] / c[:-1] - 1
+    log_r = np.full(n, np.nan)
+    log_r[1:] = np.log(c[1:] / c[:-1])
+    delta = np.zeros(n)
+    delta[1:] = np.diff(c)
+    gain = rolling(np.where(delta > 0, delta, 0), 14, np.mean)
+    loss = rolling(np.where(delta < 0, -delta, 0), 14, np.mean)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - 100 / (1 + gain / loss)
+    momentum = np.full(n, np.nan)
+    momentum[10:] = c[10:] / c[:-10] - 1
+    vol_30 = rolling(r, 30, np.std, ddof=1)
+    sums = np.concatenate([[0.0], np.cumsum(c)])
+    sma_cost = np.full(n, np.nan)
+    sma_cost[SMA_WINDOW - 1:] = (sums[SMA_WINDOW:] - sums[:-SMA_WINDOW]) / SMA_WINDOW
+
+    out[:, 0] = r
+    out[:, 1] = log_r
+    out[:, 2] = vol_30 * np.sqrt(252)
+    out[:, 3] = rolling(c, 5, np.mean)
+    out[:, 4] = rolling(c, 20, np.mean)
+    out[:, 5] = rolling(c, 50, np.mean)
+    out[:, 6] = rsi
+    out[:, 7] = v / rolling(v, 30, np.mean)
+    out[:, 8] = momentum
+    out[:, 9] = rolling(r, 5, np.std, ddof=1)
+    out[:, 10] = rolling(r, 10, np.std, ddof=1)
+    out[:, 11] = vol_30
+    out[:, 12] = c / sma_cost * c / growth_valuation(timestamps)
+
+    # Mask rows whose windows reach back into another series (or before the start)
+    position = np.arange(n)
+    if group_ids is not None:
+        group_ids = np.asarray(group_ids)
+        starts = np.flatnonzero(np.r_[True, group_ids[1:] != group_ids[:-1]])
+        position = position - np.repeat(starts, np.diff(np.r_[starts, n]))
+    out[position < MIN_HISTORY - 1] = np.nan
+    return out
+
+class RollingFeatureState:
+    """
+    Rolling window of the most recent bars for constant-time feature updates
+
+    Holds only as many bars as the longest indicator window needs (the
+    200-day SMA cost of ahr999, kept as a running sum), so folding in a new
+    bar and rebuilding the feature vector costs the same no matter how long
+    the history is. The features match the last row of
+    BitcoinRiskModel.create_features().
+    """
+    CLOSE_WINDOW = MIN_HISTORY
+    VOLUME_WINDOW = 30
+
+    def __init__(self, closes, volumes, last_timestamp, interval=86400.0, timestamps=None):
+        """
+        Args:
+            closes: Most recent closing prices, oldest first
+            volumes: Most recent volumes, oldest first (at least
+                VOLUME_WINDOW; older bars without one are NaN)
+            last_timestamp (float): Epoch seconds of the latest bar
+            interval (float): Bar spacing in seconds
+            timestamps: Epoch seconds of the bars (default: spaced one
+                interval apart up to last_timestamp)
+        """
+        closes = np.asarray(closes, dtype=float)[-self.CLOSE_WINDOW:]
+        volumes = np.asarray(volumes, dtype=float)[-self.CLOSE_WINDOW:]
+        if len(closes) < self.CLOSE_WINDOW or len(volumes) < self.VOLUME_WINDOW:
+            raise ValueError(f"Need at least {self.CLOSE_WINDOW} bars to seed the feature state")
+        if timestamps is None:
+            timestamps = last_timestamp - interval * np.arange(self.CLOSE_WINDOW)[::-1]
+
+        # Closes, volumes, bar timestamps, the latest timestamp, a revision
+        # counter and the running sum of the closes live in one flat buffer
+        self._attach(np.empty(3 * self.CLOSE_WINDOW + 3))
+        self.closes[:] = closes
+        self.volumes[:] = np.nan
+        self.volumes[-len(volumes):] = volumes
+        self.timestamps[:] = np.asarray(timestamps, dtype=float)[-self.CLOSE_WINDOW:]
+        self._meta[:] = (last_timestamp, 0, closes.sum())
+        self.interval = float(interval)
+        self._lock = threading.Lock()
+
+    def _attach(self, buffer):
+        """Point the window views at a flat float64 buffer"""
+        self._buffer = buffer
+        n = self.CLOSE_WINDOW
+        self.closes = buffer[:n]
+        self.volumes = buffer[n:2 * n]
+        self.timestamps = buffer[2 * n:3 * n]
+        self._meta = buffer[-3:]
+
+    @property
+    def last_timestamp(self):
+        """Epoch seconds of the latest bar"""
+        return float(self._meta[0])
+
+    @property
+    def revision(self):
+        """Number of bars folded in so far (changes with every update)"""
+        return int(self._meta[1])
+
+    def share(self):
+        """
+        Move the window into anonymous shared memory
+
+        Call before forking worker processes: every worker then reads and
+        updates the same window under a process-shared lock, so a bar posted
+        to one worker is seen by all of them.
+        """
+        shared = np.frombuffer(mmap.mmap(-1, self._buffer.nbytes), dtype=float)
+        shared[:] = self._buffer
+        self._attach(shared)
+        self._lock = multiprocessing.Lock()
+        return self
+
+    @classmethod
+    def from_frame(cls, df):
+        """Seed the state from the tail of a Date-indexed OHLCV DataFrame"""
+        tail = df.tail(cls.CLOSE_WINDOW)
+        interval = tail.index.to_series().diff().median().total_seconds()
+        timestamps = tail.index.as_unit('s').asi8.astype(float)
+        return cls(tail['Close'].to_numpy(), tail['Volume'].to_numpy(), timestamps[-1], interval, timestamps)
+
+    @staticmethod
+    def to_epoch(timestamp):
+        """Convert an ISO timestamp string to epoch seconds (naive means UTC)"""
+        ts = datetime.fromisoformat(timestamp)
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return ts.timestamp()
+
+    def update(self, timestamp, close, volume, on_accept=None):
+        """
+        Fold a bar into the state
+
+        A bar newer than the latest one is appended; a bar with the same
+        timestamp replaces the latest bar (intra-bar update). Bars more than
+        one interval after both the latest bar and the current time are
+        rejected, so a far-future timestamp cannot lock out real bars, and
+        so are non-positive or non-finite closes and negative or non-finite
+        volumes, which would poison every feature vector of the window.
+
+        Args:
+            on_accept (callable): Called as on_accept(epoch_seconds, close)
+                under the state lock once the bar passed the checks and
+                before the state changes; a ValueError from it rejects the
+                bar and leaves the state untouched
+
+        Returns:
+            np.ndarray: feature vector of shape (1, n_features) for the bar
+        """
+        ts = self.to_epoch(timestamp) if isinstance(timestamp, str) else float(timestamp)
+        close, volume = float(close), float(volume)
+        if not (np.isfinite(close) and close > 0):
+            raise ValueError("Close must be a positive finite number")
+        if not (np.isfinite(volume) and volume >= 0):
+            raise ValueError("Volume must be a non-negative finite number")
+        with self._lock:
+            if ts < self.last_timestamp:
+                raise ValueError("Bar is older than the latest bar in the feature state")
+            if ts > max(self.last_timestamp, time.time()) + self.interval:
+                raise ValueError("Bar is more than one interval in the future")
+            if on_accept is not None:
+                on_accept(ts, close)
+            if ts > self.last_timestamp:
+                self._meta[2] -= self.closes[0]
+                self.closes[:-1] = self.closes[1:]
+                self.volumes[:-1] = self.volumes[1:]
+                self.timestamps[:-1] = self.timestamps[1:]
+                self.timestamps[-1] = ts
+                self._meta[0] = ts
+            else:
+                self._meta[2] -= self.closes[-1]
+            self.closes[-1] = close
+            self.volumes[-1] = volume
+            self._meta[2] += close
+            self._meta[1] += 1
+            # Re-sum now and then so floating-point error cannot accumulate
+            if self._meta[1] % self.CLOSE_WINDOW == 0:
+                self._meta[2] = self.closes.sum()
+            return self.features()
+
+    def bars_since(self, timestamp):
+        """
+        Bars in the window newer than a timestamp
+
+        Args:
+            timestamp (float): Epoch seconds
+
+        Returns:
+            pd.DataFrame: UTC Date-indexed Close and Volume columns
+        """
+        import pandas as pd
+
+        with self._lock:
+            newer = self.timestamps > timestamp
+            closes, volumes = self.closes[newer].copy(), self.volumes[newer].copy()
+            timestamps = self.timestamps[newer].copy()
+        index = pd.to_datetime(timestamps, unit='s', utc=True).rename('Date')
+        return pd.DataFrame({'Close': closes, 'Volume': volumes}, index=index)
+
+    def latest_features(self):
+        """Feature vector for the latest bar, read under the state lock"""
+        with self._lock:
+            return self.features()
+
+    def snapshot(self):
+        """
+        Consistent view of the latest bar
+
+        Returns:
+            dict: timestamp, close, revision, feature vector and ahr999 index
+        """
+        with self._lock:
+            return {
+                'timestamp': self.last_timestamp,
+                'close': float(self.closes[-1]),
+                'revision': self.revision,
+                'features': self.features(),
+                'ahr999': self.ahr999(),
+            }
+
+    def ahr999(self):
+        """ahr999 index of the latest bar from the running SMA cost sum"""
+        close = self.closes[-1]
+        sma_cost = self._meta[2] / self.CLOSE_WINDOW
+        growth = growth_valuation(self._meta[:1])[0]
+        return float(close / sma_cost * close / growth)
+
+    def features(self):
+        """Feature vector for the latest bar in FEATURE_COLUMNS order"""
+        c = self.closes[-MA_WINDOW:]
+        returns = c[1:] / c[:-1] - 1
+        delta = np.diff(c[-15:])
+        gain = np.where(delta > 0, delta, 0).mean()
+        loss = np.where(delta < 0, -delta, 0).mean()
+        with np.errstate(divide='ignore'):
+            rsi = 100 - 100 / (1 + gain / loss)
+
+        return np.array([[
+            returns[-1],
+            np.log(c[-1] / c[-2]),
+            returns[-30:].std(ddof=1) * np.sqrt(252),
+            c[-5:].mean(),
+            c[-20:].mean(),
+            c.mean(),
+            rsi,
+            self.volumes[-1] / self.volumes[-self.VOLUME_WINDOW:].mean(),
+            c[-1] / c[-11] - 1,
+            returns[-5:].std(ddof=1),
+            returns[-10:].std(ddof=1),
+            returns[-30:].std(ddof=1),
+            self.ahr999(),
+        ]])
@@ -0,0 +1,104 @@
+# job_registry.py
+import json
+import mmap
+import multiprocessing
+import os
+import threading
+
+# Shared segment size; the serialized records of max_jobs jobs must fit
+SHARED_BYTES = 1 << 20
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class JobRegistry:
+    """
+    Background job records with at most one running job
+
+    Records are JSON-serializable dicts keyed by 'job_id'. They start out in
+    process memory; share() moves them into an anonymous shared-memory
+    segment under a process-shared lock before worker processes are
+    forked, like RollingFeatureState, so every worker sees the same jobs and
+    the running-job guard holds across all of them. Only the most recent
+    max_jobs records are kept.
+    """
+
+    def __init__(self, max_jobs=50):
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._segment = None
+        self._lock = threading.Lock()
+
+    def share(self):
+        """Move the records into anonymous shared memory (call before forking)"""
+        self._segment = mmap.mmap(-1, SHARED_BYTES)
+        self._lock = multiprocessing.Lock()
+        self._store(self._jobs)
+        return self
+
+    def _load(self):
+        if self._segment is None:
+            return self._jobs
+        size = int.from_bytes(self._segment[:8], 'little')
+        return json.loads(self._segment[8:8 + size]) if size else {}
+
+    def _store(self, jobs):
+        if len(jobs) > self.max_jobs:
+            oldest = sorted(jobs, key=lambda job_id: jobs[job_id]['started_at'])
+            for job_id in oldest[:len(jobs) - self.max_jobs]:
+                del jobs[job_id]
+        if self._segment is None:
+            self._jobs = jobs
+            return
+        data = json.dumps(jobs).encode()
+        if len(data) + 8 > SHARED_BYTES:
+            raise ValueError("Job records do not fit in the shared segment")
+        self._segment[8:8 + len(data)] = data
+        self._segment[:8] = len(data).to_bytes(8, 'little')
+
+    def start(self, job):
+        """
+        Register a running job unless another one is running
+
+        The job gets the current process id as its owner; running jobs whose
+        owner has exited are marked failed first.
+
+        Returns:
+            dict: the job that is already running, or None if job was registered
+        """
+        with self._lock:
+            jobs = self._load()
+            for record in jobs.values():
+                if record['status'] == 'running':
+                    if _alive(record['pid']):
+                        return record
+                    record.update(status='failed', error='Worker process exited')
+            jobs[job['job_id']] = dict(job, status='running', pid=os.getpid())
+            self._store(jobs)
+        return None
+
+    def update(self, job_id, **fields):
+        """Set fields of a job record"""
+        with self._lock:
+            jobs = self._load()
+            if job_id in jobs:
+                jobs[job_id].update(fields)
+                self._store(jobs)
+
+    def get(self, job_id):
+        """Job record, or None if unknown"""
+        with self._lock:
+            record = self._load().get(job_id)
+        return dict(record) if record is not None else None
+
+    def list(self):
+        """All job records, most recent first"""
+        with self._lock:
+            jobs = [dict(record) for record in self._load().values()]
+        return sorted(jobs, key=lambda job: job['started_at'], reverse=True)
@@ -0,0 +1,215 @@
+# liquidation_cascade.py
+import numpy as np
+from RiskAnalysis import LendingRiskAnalyzer
+from profiling import instrumented
+
+class SquareRootImpact:
+    """
+    Square-root law: selling q BTC moves the price by coefficient * sigma * sqrt(q / V)
+
+    Args:
+        daily_volume (float): Traded volume V in BTC per day
+        daily_volatility (float): Daily return volatility sigma
+        coefficient (float): Impact coefficient (about 1 in empirical studies)
+    """
+
+    def __init__(self, daily_volume=300_000.0, daily_volatility=0.035, coefficient=1.0):
+        self.daily_volume = daily_volume
+        self.daily_volatility = daily_volatility
+        self.coefficient = coefficient
+
+    def __call__(self, sold):
+        return np.exp(-self.coefficient * self.daily_volatility * np.sqrt(sold / self.daily_volume))
+
+class OrderBookImpact:
+    """
+    Exponentially thinning order book: each `depth` BTC sold costs a factor e of price
+
+    Args:
+        depth (float): BTC that moves the log price by one
+    """
+
+    def __init__(self, depth=200_000.0):
+        self.depth = depth
+
+    def __call__(self, sold):
+        return np.exp(-sold / self.depth)
+
+class ConstantProductImpact:
+    """
+    Selling into an x * y = k pool holding pool_btc BTC
+
+    Args:
+        pool_btc (float): BTC side of the pool
+    """
+
+    def __init__(self, pool_btc=50_000.0):
+        self.pool_btc = pool_btc
+
+    def __call__(self, sold):
+        return (self.pool_btc / (self.pool_btc + sold)) ** 2
+
+IMPACT_MODELS = {
+    'sqrt': SquareRootImpact,
+    'orderbook': OrderBookImpact,
+    'amm': ConstantProductImpact,
+}
+
+@instrumented
+class LiquidationCascadeSimulator:
+    """
+    Liquidation cascades of a BTC-collateralised loan book after a price shock
+
+    Loans are ordered once by the price at which they become liquidatable,
+    highest first; that sorted array is the priority queue. Every wave
+    liquidates all loans whose trigger price is at or above the current
+    price. The pointer into the queue only moves forward, so each loan is
+    visited once. The collateral sold in the wave moves the price through
+    the impact model, which may trigger the next wave. The cascade settles
+    when a wave triggers no further loans.
+
+    Impact is a function of the cumulative BTC sold (multiplier of the
+    shocked price), so any callable sold -> multiplier can be used.
+    Liquidations close the whole loan; the collateral of a wave is sold at
+    the average of the prices before and after it, less the liquidation
+    bonus paid to liquidators.
+    """
+
+    def __init__(self, impact='sqrt', liquidation_ltv=LendingRiskAnalyzer.LIQUIDATION_LTV,
+                 liquidation_bonus=0.05):
+        """
+        Args:
+            impact (str or callable): 'sqrt', 'orderbook', 'amm' (default
+                parameters) or a callable mapping BTC sold to a price multiplier
+            liquidation_ltv (float): LTV at which a loan is liquidated
+            liquidation_bonus (float): Share of sale proceeds kept by liquidators
+        """
+        self.impact = IMPACT_MODELS[impact]() if isinstance(impact, str) else impact
+        self.liquidation_ltv = liquidation_ltv
+        self.liquidation_bonus = liquidation_bonus
+
+    def trigger_prices(self, collateral, loan_amount):
+        """BTC price at which each loan reaches the liquidation LTV"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            trigger = loan_amount / (collateral * self.liquidation_ltv)
+        # Loans without debt never trigger; loans without collateral always do
+        return np.where(loan_amount > 0, trigger, 0.0)
+
+    def simulate(self, btc_price, collateral, loan_amount, price_shock):
+        """
+        Run the cascade
+
+        Args:
+            btc_price (float): Price before the shock
+            collateral (array-like): BTC collateral per loan
+            loan_amount (array-like): Outstanding debt per loan (USD)
+            price_shock (float): Initial price move, e.g. -0.3
+
+        Returns:
+            dict: prices, cascade depth (waves), liquidated loans, collateral
+            and debt, bad debt, per-wave detail and per-loan arrays 'wave'
+            (0 for loans that survive) and 'loan_bad_debt'
+        """
+        collateral = np.asarray(collateral, dtype=float)
+        loan_amount = np.asarray(loan_amount, dtype=float)
+        # Negated trigger prices, so the queue is ascending for searchsorted
+        negated = -self.trigger_prices(collateral, loan_amount)
+        order = np.argsort(negated, kind='stable')
+        queue = negated[order]
+        sold_cumulative = np.cumsum(collateral[order])
+
+        shocked_price = btc_price * (1 + price_shock)
+        price = shocked_price
+        wave_of = np.zeros(len(order), dtype=np.int32)
+        proceeds = np.zeros(len(order))
+        waves = []
+        done = 0
+        while True:
+            end = int(np.searchsorted(queue, -price, side='right'))
+            if end == done:
+                break
+            sold = sold_cumulative[end - 1]
+            next_price = shocked_price * float(self.impact(sold))
+            execution_price = (price + next_price) / 2
+            wave_of[done:end] = len(waves) + 1
+            proceeds[done:end] = collateral[order[done:end]] * execution_price * (1 - self.liquidation_bonus)
+            waves.append({
+                'wave': len(waves) + 1,
+                'loans': end - done,
+                'collateral': float(sold - (sold_cumulative[done - 1] if done else 0.0)),
+                'price_before': float(price),
+                'price_after': float(next_price),
+            })
+            price = next_price
+            done = end
+
+        liquidated = order[:done]
+        bad_debt = np.zeros(len(order))
+        bad_debt[liquidated] = np.maximum(loan_amount[liquidated] - proceeds[:done], 0)
+        loan_wave = np.zeros(len(order), dtype=np.int32)
+        loan_wave[order] = wave_of
+        return {
+            'initial_price': float(btc_price),
+            'shocked_price': float(shocked_price),
+            'final_price': float(price),
+            'total_price_change': float(price / btc_price - 1),
+            'cascade_price_change': float(price / shocked_price - 1),
+            'cascade_depth': len(waves),
+            'liquidated_loans': int(done),
+            'liquidated_collateral': float(sold_cumulative[done - 1]) if done else 0.0,
+            'liquidated_debt': float(loan_amount[liquidated].sum()),
+            'bad_debt': float(bad_debt.sum()),
+            'bad_debt_loans': int((bad_debt > 0).sum()),
+            'waves': waves,
+            'wave': loan_wave,
+            'loan_bad_debt': bad_debt,
+        }
+
+def synthetic_loan_book(n_loans, btc_price, seed=0):
+    """
+    Loan book with lognormal collateral sizes and LTVs between 20% and 85%
+
+    Returns:
+        tuple: (collateral in BTC, loan amounts in USD)
+    """
+    rng = np.random.default_rng(seed)
+    collateral = rng.lognormal(-1.5, 1.2, n_loans)
+    ltv = rng.beta(4, 3, n_loans) * 0.65 + 0.2
+    return collateral, collateral * btc_price * ltv
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Simulate a liquidation cascade on a loan book")
+    parser.add_argument('--loans', type=int, default=1_000_000, help="Size of the synthetic loan book")
+    parser.add_argument('--book', help="CSV with collateral and loan_amount columns (instead of a synthetic book)")
+    parser.add_argument('--btc-price', type=float, default=90000.0)
+    parser.add_argument('--shock', type=float, default=-0.25, help="Initial price move, e.g. -0.25")
+    parser.add_argument('--impact', choices=list(IMPACT_MODELS), default='sqrt')
+    parser.add_argument('--liquidation-bonus', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.book:
+        import pandas as pd
+        book = pd.read_csv(args.book)
+        collateral, loan_amount = book['collateral'].to_numpy(), book['loan_amount'].to_numpy()
+    else:
+        collateral, loan_amount = synthetic_loan_book(args.loans, args.btc_price, args.seed)
+
+    simulator = LiquidationCascadeSimulator(args.impact, liquidation_bonus=args.liquidation_bonus)
+    start = time.perf_counter()
+    result = simulator.simulate(args.btc_price, collateral, loan_amount, args.shock)
+    elapsed = time.perf_counter() - start
+
+    print(f"Loans: {len(collateral):,} ({elapsed:.2f}s)")
+    print(f"Price: ${result['initial_price']:,.0f} -> ${result['shocked_price']:,.0f} (shock) "
+          f"-> ${result['final_price']:,.0f} (after cascade, {result['cascade_price_change']:+.2%})")
+    print(f"Cascade depth: {result['cascade_depth']} waves")
+    print(f"Liquidated: {result['liquidated_loans']:,} loans, {result['liquidated_collateral']:,.1f} BTC, "
+          f"${result['liquidated_debt']:,.0f} debt")
+    print(f"Bad debt: ${result['bad_debt']:,.0f} across {result['bad_debt_loans']:,} loans")
+
+if __name__ == "__main__":
+    main()
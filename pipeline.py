@@ -0,0 +1,287 @@
+# pipeline.py
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import hashlib
+import json
+import os
+import sys
+import time
+import profiling
+from DataPrep import is_compact, load_market_data
+
+# Heavy modules (yfinance, sklearn, matplotlib) are imported inside the stage
+# functions, so skipped stages never load them
+
+DATA_PATH = 'output/btc_raw_data.csv'
+MANIFEST_PATH = 'output/pipeline_manifest.json'
+# Stored columns the stages read
+DATA_COLUMNS = ['Close', 'Returns', 'Volume']
+
+# Price data loaded once by the orchestrator and inherited by every stage worker
+_stage_data = None
+
+def _init_stage_worker(data):
+    global _stage_data
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+    _stage_data = data
+
+def fetch_stage(data):
+    """Download the full price history"""
+    from DataPrep import BitcoinDataLoader
+    loader = BitcoinDataLoader()
+    if loader.fetch_data(period="max") is None:
+        raise RuntimeError("No price data fetched")
+    loader.save_data_and_report()
+
+def analysis_stage(data):
+    """Lending protocol parameters and their text report"""
+    from RiskAnalysis import LendingRiskAnalyzer
+    LendingRiskAnalyzer(data=data).analyze_risk_parameters()
+
+def train_stage(data):
+    """Train and save the risk models"""
+    from RiskMLModel import BitcoinRiskModel
+    BitcoinRiskModel(data=data).train_models()
+
+def plots_stage(data):
+    """Render the report figures (unchanged figures are skipped by the visualizer)"""
+    from RiskVisualization import RiskVisualizer
+    RiskVisualizer(data=data).generate_all_plots(parallel=(os.cpu_count() or 1) > 2)
+
+def report_stage(data):
+    """Write the markdown report around the rendered figures"""
+    from report_generator import ReportGenerator
+    ReportGenerator(data=data).generate_report(plots=False)
+
+class Stage:
+    """
+    One step of the pipeline
+
+    A stage runs when any of its input files (data and the source files
+    whose code it runs) changed since its last successful run, or when one
+    of its output files is missing. Stages whose upstream stages are done
+    run in parallel.
+    """
+
+    def __init__(self, name, func, inputs, outputs, after=(), local=False):
+        """
+        Args:
+            name (str): Stage name
+            func: Module-level function called with the loaded price data
+            inputs (list): Files the stage reads, including its source files
+            outputs (list): Files the stage writes
+            after (tuple): Stages that must finish first
+            local (bool): Run in the orchestrator process instead of a worker
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = tuple(after)
+        self.local = local
+
+def _figure_files():
+    from RiskVisualization import RiskVisualizer
+    return [f'output/figures/{name}.png' for _, _, name, _ in RiskVisualizer.PLOTS]
+
+MODEL_FILES = [f'output/models/{name}.pkl' for name in (
+    'risk_level_classifier', 'risk_level_scaler', 'price_direction_classifier',
+    'price_direction_scaler', 'volatility_regressor', 'volatility_scaler')]
+
+# Modules imported by every component a data stage runs (loading and instrumentation)
+SHARED_SOURCES = ['DataPrep.py', 'profiling.py']
+
+STAGES = [
+    Stage('fetch', fetch_stage, SHARED_SOURCES, [DATA_PATH, 'output/btc_analysis_report.txt'], local=True),
+    Stage('analysis', analysis_stage, [DATA_PATH, 'RiskAnalysis.py', *SHARED_SOURCES],
+          ['output/lending_risk_analysis.txt'], after=['fetch']),
+    Stage('train', train_stage, [DATA_PATH, 'RiskMLModel.py', 'feature_state.py', 'ahr999_index.py',
+                                 'downsampling.py', *SHARED_SOURCES],
+          MODEL_FILES, after=['fetch']),
+    Stage('plots', plots_stage, [DATA_PATH, 'RiskVisualization.py', 'downsampling.py', *SHARED_SOURCES],
+          _figure_files(), after=['fetch']),
+    Stage('report', report_stage, [DATA_PATH, 'report_generator.py', 'RiskVisualization.py',
+                                   'downsampling.py', *SHARED_SOURCES],
+          ['output/report/risk_analysis_report.md'], after=['plots']),
+]
+
+def _run_stage(func):
+    """Run a stage in a worker process with the shared price data"""
+    start = time.perf_counter()
+    with profiling.span(func.__name__):
+        func(_stage_data)
+    return time.perf_counter() - start, profiling.drain()
+
+class Pipeline:
+    """
+    Runs the stages in dependency order, independent ones in parallel
+
+    The price data is read once and handed to a process pool when it is
+    created, so forked workers share it instead of re-reading the CSV.
+    Fingerprints of each stage's inputs are kept in MANIFEST_PATH; a stage
+    whose fingerprint and outputs are unchanged is skipped.
+    """
+
+    def __init__(self, stages=STAGES, manifest_path=MANIFEST_PATH):
+        self.stages = {stage.name: stage for stage in stages}
+        self.manifest_path = manifest_path
+        self._file_hashes = {}
+
+    def _file_hash(self, path):
+        if path not in self._file_hashes:
+            digest = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+            self._file_hashes[path] = digest.hexdigest()
+        return self._file_hashes[path]
+
+    def fingerprint(self, stage):
+        """Hash of a stage's input files and the loading mode; None if a file is missing"""
+        if not all(os.path.exists(path) for path in stage.inputs):
+            return None
+        # Compact loading changes the data the stages see, so it is its own variant
+        digest = hashlib.sha1((stage.name + (':compact' if is_compact() else '')).encode())
+        for path in stage.inputs:
+            digest.update(f"{path}:{self._file_hash(path)}".encode())
+        return digest.hexdigest()
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return {}
+
+    def _is_current(self, stage, manifest):
+        fingerprint = self.fingerprint(stage)
+        return (fingerprint is not None and manifest.get(stage.name) == fingerprint
+                and all(os.path.exists(path) for path in stage.outputs))
+
+    def _needs_run(self, stage, manifest, fetch, force):
+        if force:
+            return True
+        if stage.name == 'fetch':
+            return fetch or not os.path.exists(DATA_PATH)
+        return not self._is_current(stage, manifest)
+
+    def run(self, only=None, fetch=False, force=False, workers=None, dry_run=False):
+        """
+        Run the stale stages
+
+        A stage is checked once its upstream stages have finished, so it
+        sees the data they wrote.
+
+        Args:
+            only (list): Stage names to consider (default: all); other
+                stages are treated as up to date
+            fetch (bool): Download fresh data (otherwise fetch runs only
+                when the data file is missing)
+            force (bool): Run the selected stages even if they are current
+            workers (int): Process pool size (default: one per stage, up to the CPU count)
+            dry_run (bool): Only report which stages would run
+
+        Returns:
+            dict: 'status' (stage name -> 'ran', 'skipped', 'failed' or
+            'blocked') and 'timings' (seconds per stage that ran)
+        """
+        manifest = self._load_manifest()
+        pending = [name for name in self.stages if only is None or name in only]
+        selected = list(pending)
+        status, timings, running = {}, {}, {}
+        pool = None
+        start = time.perf_counter()
+        try:
+            while pending or running:
+                for name in list(pending):
+                    stage = self.stages[name]
+                    # None while an upstream stage is pending or running
+                    upstream = [status.get(dep) for dep in stage.after if dep in selected]
+                    if any(state in ('failed', 'blocked') for state in upstream):
+                        pending.remove(name)
+                        status[name] = 'blocked'
+                        print(f"[{name}] blocked by a failed upstream stage")
+                        continue
+                    if None in upstream:
+                        continue
+                    pending.remove(name)
+                    # In a dry run a stage behind one that would run would see new inputs
+                    if not (self._needs_run(stage, manifest, fetch, force)
+                            or dry_run and 'ran' in upstream):
+                        status[name] = 'skipped'
+                        print(f"[{name}] up to date")
+                    elif dry_run:
+                        status[name] = 'ran'
+                        print(f"[{name}] would run")
+                    elif stage.local:
+                        print(f"[{name}] running")
+                        t = time.perf_counter()
+                        try:
+                            with profiling.span(stage.func.__name__):
+                                stage.func(None)
+                            status[name] = 'ran'
+                        except Exception as e:
+                            status[name] = 'failed'
+                            print(f"[{name}] failed: {str(e)}")
+                        timings[name] = time.perf_counter() - t
+                        self._file_hashes.clear()
+                    else:
+                        if pool is None:
+                            size = workers or min(len(self.stages), os.cpu_count() or 1)
+                            data = load_market_data(DATA_PATH, DATA_COLUMNS)
+                            pool = ProcessPoolExecutor(max_workers=size, initializer=_init_stage_worker,
+                                                       initargs=(data,))
+                        print(f"[{name}] running")
+                        running[pool.submit(_run_stage, stage.func)] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        timings[name], trace = future.result()
+                        profiling.merge(trace)
+                        status[name] = 'ran'
+                        print(f"[{name}] done in {timings[name]:.1f}s")
+                    except Exception as e:
+                        status[name] = 'failed'
+                        print(f"[{name}] failed: {str(e)}")
+                self._file_hashes.clear()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if dry_run:
+            return {'status': status, 'timings': timings}
+
+        # Record the inputs each stage that ran was built from
+        for name, state in status.items():
+            if state == 'ran' and name != 'fetch':
+                manifest[name] = self.fingerprint(self.stages[name])
+        os.makedirs(os.path.dirname(self.manifest_path) or '.', exist_ok=True)
+        with open(self.manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+        elapsed = time.perf_counter() - start
+        print(f"\nPipeline finished in {elapsed:.1f}s (longest stage {max(timings.values(), default=0):.1f}s)")
+        for name in selected:
+            print(f"  {name:10s} {status[name]:8s}" + (f" {timings[name]:7.1f}s" if name in timings else ""))
+        return {'status': status, 'timings': timings}
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the data, analysis, training, plotting and report pipeline")
+    parser.add_argument('--fetch', action='store_true', help="Download fresh price data first")
+    parser.add_argument('--stages', nargs='+', choices=[stage.name for stage in STAGES],
+                        help="Only consider these stages")
+    parser.add_argument('--force', action='store_true', help="Run the selected stages even if they are up to date")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--dry-run', action='store_true', help="Only show which stages would run")
+    args = parser.parse_args(argv)
+
+    result = Pipeline().run(only=args.stages, fetch=args.fetch, force=args.force,
+                            workers=args.workers, dry_run=args.dry_run)
+    if any(state in ('failed', 'blocked') for state in result['status'].values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
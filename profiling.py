@@ -0,0 +1,215 @@
+# profiling.py
+import atexit
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+# Set to an output path (or 1 for output/profile/<time>.json) to profile a run
+PROFILE_ENV = 'BTC_RISK_PROFILE'
+
+_enabled = False
+_output = None
+_owner_pid = None
+_classes = []
+_events = []
+# (pid, call stack) -> self time in microseconds
+_folded = {}
+_lock = threading.Lock()
+_local = threading.local()
+_NULL_SPAN = nullcontext()
+
+def _rss_bytes():
+    """Resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _rows(instance, args):
+    """Rows processed by a call: the first array-like argument, else the instance's data"""
+    for value in args:
+        shape = getattr(value, 'shape', None)
+        if shape:
+            return int(shape[0])
+    for attr in ('data', 'historical_data'):
+        shape = getattr(getattr(instance, attr, None), 'shape', None)
+        if shape:
+            return int(shape[0])
+    return None
+
+class _Span:
+    """One timed region; nested spans form the call stack of the flame graph"""
+
+    def __init__(self, name, category):
+        self.name = name
+        self.category = category
+        self.rows = None
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.child_ns = 0
+        self.rss = _rss_bytes()
+        self.cpu = time.process_time_ns()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter_ns() - self.start
+        cpu = time.process_time_ns() - self.cpu
+        rss_delta = _rss_bytes() - self.rss
+        stack = _local.stack
+        path = ';'.join(span.name for span in stack)
+        stack.pop()
+        if stack:
+            stack[-1].child_ns += duration
+        pid = os.getpid()
+        event = {
+            'name': self.name, 'cat': self.category, 'ph': 'X', 'pid': pid,
+            'tid': threading.get_ident(), 'ts': self.start / 1000, 'dur': duration / 1000,
+            'args': {'cpu_ms': cpu / 1e6, 'rss_delta_mb': rss_delta / 2**20, 'rows': self.rows},
+        }
+        with _lock:
+            _events.append(event)
+            key = (pid, path)
+            _folded[key] = _folded.get(key, 0) + (duration - self.child_ns) / 1000
+        return False
+
+def span(name):
+    """
+    Time a region inside a method (e.g. model fitting or figure saving)
+
+    Returns a shared no-op context manager while profiling is disabled.
+    """
+    return _Span(name, 'step') if _enabled else _NULL_SPAN
+
+def _wrap(cls, name, func):
+    label = f"{cls.__name__}.{name}"
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with _Span(label, cls.__module__) as current:
+            result = func(self, *args, **kwargs)
+            current.rows = _rows(self, args)
+            return result
+    return wrapper
+
+def _instrument(cls):
+    if cls.__dict__.get('_profiled'):
+        return
+    for name, value in list(vars(cls).items()):
+        if inspect.isfunction(value) and (not name.startswith('_') or name == '__init__'):
+            setattr(cls, name, _wrap(cls, name, value))
+    cls._profiled = True
+
+def instrumented(cls):
+    """
+    Class decorator registering the public methods (and __init__) for profiling
+
+    Methods are only wrapped once profiling is enabled, so a disabled
+    profiler leaves the class untouched and costs nothing per call.
+    """
+    _classes.append(cls)
+    if _enabled:
+        _instrument(cls)
+    return cls
+
+def enable(output=None):
+    """
+    Start recording spans; the trace is written when the process exits
+
+    Args:
+        output (str): Chrome trace file (default: output/profile/<time>.json);
+            collapsed stacks for flame graph tools go next to it as .folded
+    """
+    global _enabled, _output, _owner_pid
+    if _enabled:
+        return
+    _enabled = True
+    _output = output or os.path.join('output', 'profile', f"{datetime.now():%Y%m%dT%H%M%S}.json")
+    _owner_pid = os.getpid()
+    for cls in _classes:
+        _instrument(cls)
+    atexit.register(_write_at_exit)
+
+def is_enabled():
+    return _enabled
+
+def drain():
+    """
+    Take the spans recorded by this process
+
+    Worker processes return this to the parent, which passes it to merge(),
+    so one trace covers the whole run. None while profiling is disabled.
+    """
+    if not _enabled:
+        return None
+    pid = os.getpid()
+    with _lock:
+        # Forked workers inherit the parent's spans; only hand back their own
+        events = [e for e in _events if e['pid'] == pid]
+        folded = {key: us for key, us in _folded.items() if key[0] == pid}
+        _events[:] = [e for e in _events if e['pid'] != pid]
+        for key in folded:
+            del _folded[key]
+    return {'events': events, 'folded': folded}
+
+def merge(trace):
+    """Add spans drained in another process"""
+    if not trace:
+        return
+    with _lock:
+        _events.extend(trace['events'])
+        for key, us in trace['folded'].items():
+            key = tuple(key)
+            _folded[key] = _folded.get(key, 0) + us
+
+def summary(limit=15):
+    """Calls, wall and CPU time per span name, slowest first"""
+    totals = {}
+    for e in _events:
+        calls, wall, cpu = totals.get(e['name'], (0, 0.0, 0.0))
+        totals[e['name']] = (calls + 1, wall + e['dur'] / 1000, cpu + e['args']['cpu_ms'])
+    ranked = sorted(totals.items(), key=lambda item: -item[1][1])[:limit]
+    lines = [f"{'span':50s} {'calls':>6s} {'wall ms':>10s} {'cpu ms':>10s}"]
+    lines += [f"{name:50s} {calls:6d} {wall:10.1f} {cpu:10.1f}" for name, (calls, wall, cpu) in ranked]
+    return '\n'.join(lines)
+
+def write(path):
+    """
+    Write the Chrome trace (chrome://tracing, Perfetto, speedscope) and
+    the collapsed stacks (flamegraph.pl, speedscope) of all recorded spans
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with _lock:
+        events = list(_events)
+        stacks = {}
+        for (_, stack), us in _folded.items():
+            stacks[stack] = stacks.get(stack, 0) + us
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    folded_path = os.path.splitext(path)[0] + '.folded'
+    with open(folded_path, 'w') as f:
+        for stack, us in sorted(stacks.items()):
+            f.write(f"{stack} {max(int(us), 1)}\n")
+    return folded_path
+
+def _write_at_exit():
+    if os.getpid() != _owner_pid or not _events:
+        return
+    folded_path = write(_output)
+    print(f"\n{summary()}")
+    print(f"Profile saved to {_output} (flame graph stacks: {folded_path})")
+
+_env_output = os.environ.get(PROFILE_ENV, '')
+if _env_output and _env_output.lower() not in ('0', 'false', 'no'):
+    enable(None if _env_output.lower() in ('1', 'true', 'yes') else _env_output)
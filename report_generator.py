@@ -5,24 +5,39 @@ from datetime import datetime
 import os
 from pathlib import Path
 from RiskVisualization import RiskVisualizer
+from profiling import instrumented
 
+@instrumented
 class ReportGenerator:
-    def __init__(self, data_path='output/btc_raw_data.csv'):
-        """Initialize report generator"""
+    def __init__(self, data_path='output/btc_raw_data.csv', data=None):
+        """
+        Initialize report generator
+        
+        Args:
+            data_path (str): Raw price data, read only when data is not given
+            data (pd.DataFrame): Already loaded Date-indexed price data
+        """
         self.output_dir = 'output/report/'
         self.figures_dir = 'output/figures/'
         
         # Create output directories
         Path(self.output_dir).mkdir(parents=True, exist_ok=True)
         
-        # Initialize components
-        self.visualizer = RiskVisualizer(data_path)
-        self.data = pd.read_csv(data_path)
+        # Initialize components (the visualizer loads the data once for both)
+        self.visualizer = RiskVisualizer(data_path, data=data)
+        self.data = self.visualizer.data
     
-    def generate_report(self):
-        """Generate analysis report with visualizations"""
-        print("Generating visualizations...")
-        self.visualizer.generate_all_plots()
+    def generate_report(self, force=False, plots=True):
+        """
+        Generate analysis report with visualizations
+        
+        Args:
+            force (bool): Re-render figures even if their inputs are unchanged
+            plots (bool): Generate the figures first; False when they are
+                produced by a separate pipeline stage
+        """
+        if plots:
+            self.visualizer.generate_all_plots(parallel=True, force=force)
         
         # Calculate metrics
         returns = pd.Series(self.data['Returns']).dropna()
@@ -106,9 +121,15 @@ Recommended protocol parameters:
             f.write(markdown_content)
         print(f"Report saved to {report_path}")
 
-def main():
+def main(argv=None):
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Generate the risk analysis report")
+    parser.add_argument('--force', action='store_true', help="Re-render figures even if their inputs are unchanged")
+    args = parser.parse_args(argv)
+    
     generator = ReportGenerator()
-    generator.generate_report()
+    generator.generate_report(force=args.force)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
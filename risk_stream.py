@@ -0,0 +1,141 @@
+# risk_stream.py
+import asyncio
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+class StreamSubscriber:
+    """
+    One stream client with its own bounded queue
+
+    When the client reads slower than bars arrive, the oldest queued update
+    is dropped to make room, so a slow client falls behind by at most
+    queue_size updates and never holds up the others.
+    """
+
+    def __init__(self, queue_size=16):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, message):
+        """Queue a message without blocking, dropping the oldest if full"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        """Wait for the next message"""
+        return await self.queue.get()
+
+class RiskBroadcaster:
+    """
+    Fan-out of encoded risk updates to all stream subscribers
+
+    Updates are computed and encoded once by the publisher; publish() only
+    hands the same message to every subscriber queue. Must be used from
+    the event loop thread.
+    """
+
+    def __init__(self, queue_size=16):
+        """
+        Args:
+            queue_size (int): Updates buffered per subscriber before dropping
+        """
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.latest = None
+        self.published = 0
+
+    def subscribe(self):
+        """Register a subscriber; it starts with the latest update, if any"""
+        subscriber = StreamSubscriber(self.queue_size)
+        if self.latest is not None:
+            subscriber.offer(self.latest)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, message):
+        """Send one message to every subscriber"""
+        self.latest = message
+        self.published += 1
+        for subscriber in self.subscribers:
+            subscriber.offer(message)
+
+    def stats(self):
+        """Subscriber count and per-client backlog"""
+        return {
+            'subscribers': len(self.subscribers),
+            'published': self.published,
+            'queued': sum(s.queue.qsize() for s in self.subscribers),
+            'dropped': sum(s.dropped for s in self.subscribers),
+        }
+
+class BarSimulator:
+    """
+    Random-walk OHLCV bar generator for driving the stream locally
+
+    Closes follow a geometric random walk with the given daily volatility;
+    bars are spaced one interval apart starting after start_time.
+    """
+
+    def __init__(self, start_price=90000.0, start_time=None, interval=timedelta(days=1),
+                 volatility=0.03, volume=3e10, seed=None):
+        """
+        Args:
+            start_price (float): Close of the bar before the first generated one
+            start_time (datetime): Timestamp of that bar (default: today, UTC)
+            interval (timedelta): Spacing between bars
+            volatility (float): Standard deviation of log returns per bar
+            volume (float): Mean traded volume per bar
+            seed (int): Random seed for reproducible runs
+        """
+        if start_time is None:
+            start_time = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.close = start_price
+        self.time = start_time
+        self.interval = interval
+        self.volatility = volatility
+        self.volume = volume
+        self.rng = np.random.default_rng(seed)
+
+    def next_bar(self):
+        """Next bar as a /predict/risk payload"""
+        open_price = self.close
+        self.close = open_price * np.exp(self.rng.normal(0, self.volatility))
+        self.time += self.interval
+        spread = abs(self.rng.normal(0, self.volatility / 2))
+        return {
+            'timestamp': self.time.isoformat(),
+            'open': float(open_price),
+            'high': float(max(open_price, self.close) * (1 + spread)),
+            'low': float(min(open_price, self.close) * (1 - spread)),
+            'close': float(self.close),
+            'volume': float(self.volume * self.rng.lognormal(0, 0.3)),
+        }
+
+    def bars(self, count):
+        """Generate count consecutive bars"""
+        for _ in range(count):
+            yield self.next_bar()
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import requests
+
+    parser = argparse.ArgumentParser(description="Post simulated bars to a running API")
+    parser.add_argument('--url', default="http://localhost:8000")
+    parser.add_argument('--bars', type=int, default=100)
+    parser.add_argument('--delay', type=float, default=1.0, help="Seconds between posted bars")
+    parser.add_argument('--price', type=float, default=90000.0, help="Starting price")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    simulator = BarSimulator(start_price=args.price, seed=args.seed)
+    for bar in simulator.bars(args.bars):
+        response = requests.post(f"{args.url}/predict/risk", json=bar)
+        print(bar['timestamp'], f"{bar['close']:.2f}", response.status_code, response.json().get('risk_level'))
+        time.sleep(args.delay)
@@ -0,0 +1,188 @@
+# service_metrics.py
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import product
+import mmap
+import multiprocessing
+import threading
+import time
+import numpy as np
+
+# Request latencies in seconds (Prometheus 'le' upper bounds)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Retrain job durations in seconds
+RETRAIN_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+class _Metric:
+    """Base for metrics whose series are slots in the registry buffer"""
+    kind = None
+
+    def __init__(self, registry, name, documentation, labels, width):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.series = list(product(*labels.values())) if labels else [()]
+        self._index = {values: i for i, values in enumerate(self.series)}
+        self._width = width
+        self._registry = registry
+        self._values = registry._allocate(self, len(self.series) * width)
+
+    def _offset(self, label_values):
+        """Buffer offset of a series; unknown label values raise KeyError"""
+        return self._index[label_values] * self._width
+
+    def _labels(self, values, extra=()):
+        pairs = list(zip(self.label_names, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, registry, name, documentation, labels=None):
+        super().__init__(registry, name, documentation, labels or {}, 1)
+
+    def inc(self, *label_values, amount=1):
+        offset = self._offset(label_values)
+        with self._registry._lock:
+            self._values[offset] += amount
+
+    def render(self):
+        for values in self.series:
+            value = self._values[self._offset(values)]
+            # Labelled series show up once they have been incremented
+            if value or not values:
+                yield f"{self.name}{self._labels(values)} {value:.17g}"
+
+class Histogram(_Metric):
+    """
+    Fixed-bucket histogram
+
+    Each series stores per-bucket counts (the last one is +Inf) followed by
+    the sum of observed values; cumulative counts are built when rendering.
+    """
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labels=None, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(registry, name, documentation, labels or {}, len(self.buckets) + 2)
+
+    def observe(self, value, *label_values):
+        offset = self._offset(label_values)
+        bucket = bisect_left(self.buckets, value)
+        with self._registry._lock:
+            self._values[offset + bucket] += 1
+            self._values[offset + self._width - 1] += value
+
+    def render(self):
+        bounds = [f'{b:g}' for b in self.buckets] + ['+Inf']
+        for values in self.series:
+            offset = self._offset(values)
+            counts = np.cumsum(self._values[offset:offset + self._width - 1])
+            # Series that never saw an observation are left out
+            if not counts[-1]:
+                continue
+            for bound, count in zip(bounds, counts):
+                yield f"{self.name}_bucket{self._labels(values, [('le', bound)])} {int(count)}"
+            yield f"{self.name}_sum{self._labels(values)} {self._values[offset + self._width - 1]:.6f}"
+            yield f"{self.name}_count{self._labels(values)} {int(counts[-1])}"
+
+class MetricsRegistry:
+    """
+    Counters and histograms backed by one flat float64 buffer
+
+    Label values are declared up front, so every series has a fixed slot
+    and recording a value is a bucket search plus two additions under a
+    lock. share() moves the buffer into anonymous shared memory before
+    worker processes are forked, so any worker's /metrics reports the
+    totals of all of them.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self._buffer = np.zeros(0)
+        self._lock = threading.Lock()
+        self._shared = False
+
+    def _allocate(self, metric, size):
+        if self._shared:
+            raise RuntimeError("Metrics must be registered before the registry is shared")
+        start = len(self._buffer)
+        self._buffer = np.concatenate([self._buffer, np.zeros(size)])
+        self.metrics.append((metric, start, size))
+        # Re-point every metric at the grown buffer
+        for m, offset, length in self.metrics:
+            m._values = self._buffer[offset:offset + length]
+        return self._buffer[start:start + size]
+
+    def counter(self, name, documentation, labels=None):
+        return Counter(self, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=None, buckets=LATENCY_BUCKETS):
+        return Histogram(self, name, documentation, labels, buckets)
+
+    def share(self):
+        """Move all series into shared memory (call before forking)"""
+        shared = np.frombuffer(mmap.mmap(-1, max(self._buffer.nbytes, 8)), dtype=float)[:len(self._buffer)]
+        shared[:] = self._buffer
+        self._buffer = shared
+        for metric, offset, length in self.metrics:
+            metric._values = shared[offset:offset + length]
+        self._lock = multiprocessing.Lock()
+        self._shared = True
+        return self
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric, _, _ in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+class RequestTimer:
+    """
+    Per-request stage durations
+
+    stage() times a block; mark() records the time since the previous stage
+    ended (or the request started), which covers work done outside the
+    handler such as body parsing before it and serialization after it.
+    Durations of repeated stages are summed.
+    """
+
+    def __init__(self):
+        self.started = self.last = time.perf_counter()
+        self.durations = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.last = time.perf_counter()
+            self.durations[name] = self.durations.get(name, 0.0) + self.last - start
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.durations[name] = self.durations.get(name, 0.0) + now - self.last
+        self.last = now
+
+class _NullTimer:
+    """Stand-in when no request is being timed"""
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def mark(self, name):
+        pass
+
+NULL_TIMER = _NullTimer()
+
+# Timer of the request being handled (set by the metrics middleware)
+current_timer = ContextVar('current_timer', default=NULL_TIMER)
@@ -1,38 +1,246 @@
 # test_api.py
-import requests
+import argparse
+import asyncio
 import json
-from datetime import datetime
-import pandas as pd
-
-def test_api():
-    """Test the Bitcoin Risk Analysis API"""
-    base_url = "http://localhost:8000"
-    
-    # Test root endpoint
-    print("Testing root endpoint...")
-    response = requests.get(base_url)
-    print(response.json())
-    print()
-    
-    # Test risk prediction
-    print("Testing risk prediction...")
-    test_data = {
-        "timestamp": datetime.now().isoformat(),
-        "open": 45000.0,
-        "high": 46000.0,
-        "low": 44000.0,
-        "close": 45500.0,
-        "volume": 1000000.0
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import httpx
+import numpy as np
+from feature_state import MIN_HISTORY
+from risk_stream import BarSimulator
+
+# Bulk payload sizes: the batch holds BATCH_SYMBOLS series of MIN_HISTORY - 1
+# context bars followed by BATCH_SCORED bars with a full feature window
+BATCH_SYMBOLS = 4
+BATCH_SCORED = 50
+LOAN_BOOK_SIZE = 1000
+# Rows scored per request, reported as rows/s
+SCORED_ROWS = {'predict_batch': BATCH_SYMBOLS * BATCH_SCORED, 'loan_book': LOAN_BOOK_SIZE}
+
+def _scenarios():
+    """
+    Request factories per endpoint
+
+    Each factory returns (method, path, kwargs) for the i-th request.
+    Single-bar predictions replace the latest bar (same timestamp, new
+    close), so concurrent requests never arrive out of order and every
+    payload is a cache miss; predict_risk_cached repeats one payload.
+    Both fold their bars into the server's feature state (see MUTATING).
+    """
+    simulator = BarSimulator(seed=0)
+    bar = simulator.next_bar()
+    closes = bar['close'] * np.exp(np.random.default_rng(1).normal(0, 0.001, 100000))
+    batch = {'bars': [dict(b, symbol=f'SIM{k}-USD')
+                      for k in range(BATCH_SYMBOLS)
+                      for b in BarSimulator(seed=2 + k).bars(MIN_HISTORY - 1 + BATCH_SCORED)]}
+    rng = np.random.default_rng(3)
+    collateral = rng.uniform(0.1, 5, LOAN_BOOK_SIZE)
+    book = {
+        'btc_price': bar['close'],
+        'loans': {
+            'collateral': collateral.tolist(),
+            'loan_amount': (collateral * bar['close'] * rng.uniform(0.2, 0.95, LOAN_BOOK_SIZE)).tolist(),
+        }
+    }
+    loan = {'timestamp': bar['timestamp'], 'btc_price': bar['close'], 'collateral': 1.5, 'loan_amount': 60000}
+
+    def intra_bar(i):
+        close = float(closes[i % len(closes)])
+        return dict(bar, close=close, high=max(bar['high'], close), low=min(bar['low'], close))
+
+    return {
+        'health': lambda i: ('GET', '/health/ready', {}),
+        'predict_risk': lambda i: ('POST', '/predict/risk', {'json': intra_bar(i)}),
+        'predict_risk_cached': lambda i: ('POST', '/predict/risk', {'json': bar}),
+        'predict_batch': lambda i: ('POST', '/predict/batch', {'json': batch}),
+        'loan_risk': lambda i: ('POST', '/api/v1/predict/risk', {'json': loan}),
+        'loan_book': lambda i: ('POST', '/api/v1/predict/risk/bulk', {'json': book}),
+        'model_info': lambda i: ('GET', '/model/info', {}),
+    }
+
+# Scenarios that post bars into the live feature state; against --url they
+# only run with --mutating
+MUTATING = ('predict_risk', 'predict_risk_cached')
+
+async def run_endpoint(client, factory, requests, concurrency, warmup):
+    """
+    Send requests with a fixed number of concurrent clients
+
+    Returns:
+        dict: throughput, error count and latency percentiles in milliseconds
+    """
+    for i in range(warmup):
+        method, path, kwargs = factory(i)
+        await client.request(method, path, **kwargs)
+
+    latencies = np.zeros(requests)
+    statuses = np.zeros(requests, dtype=int)
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            method, path, kwargs = factory(warmup + i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                await response.aread()
+                statuses[i] = response.status_code
+            except httpx.HTTPError:
+                statuses[i] = 0
+            latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ms = latencies * 1000
+    return {
+        'requests': requests,
+        'errors': int(((statuses < 200) | (statuses >= 300)).sum()),
+        'throughput_rps': requests / elapsed,
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'max_ms': float(ms.max()),
     }
-    
-    response = requests.post(f"{base_url}/predict/risk", json=test_data)
-    print(json.dumps(response.json(), indent=2))
-    print()
-    
-    # Get model info
-    print("Getting model information...")
-    response = requests.get(f"{base_url}/model/info")
-    print(json.dumps(response.json(), indent=2))
+
+async def run_load_test(url, endpoints, requests, concurrency, warmup):
+    """Run the selected endpoint scenarios one after another against url"""
+    scenarios = _scenarios()
+    results = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        for name in endpoints:
+            results[name] = await run_endpoint(client, scenarios[name], requests, concurrency, warmup)
+            r = results[name]
+            rows = ''
+            if name in SCORED_ROWS:
+                r['rows_per_request'] = SCORED_ROWS[name]
+                r['rows_per_s'] = r['throughput_rps'] * SCORED_ROWS[name]
+                rows = f"  {r['rows_per_s']:10.0f} rows/s"
+            print(f"{name:20s} {r['throughput_rps']:9.1f} req/s  p50 {r['p50_ms']:8.2f}  "
+                  f"p95 {r['p95_ms']:8.2f}  p99 {r['p99_ms']:8.2f} ms  errors {r['errors']}{rows}")
+    return results
+
+def start_server(port, workers=0):
+    """Start a local API server (pre-forked with workers > 0) and wait until it is ready"""
+    if workers:
+        command = [sys.executable, 'api_service.py', '--workers', str(workers), '--port', str(port)]
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'api_service:app', '--port', str(port), '--log-level', 'warning']
+    process = subprocess.Popen(command)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 600
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{url}/health/ready").status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("API server did not become ready")
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, max_regression):
+    """
+    Print p95 latency and throughput changes against a baseline run
+
+    Returns:
+        list: endpoints whose p95 latency grew by more than max_regression
+    """
+    regressions = []
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for name, r in results['endpoints'].items():
+        base = baseline['endpoints'].get(name)
+        if base is None:
+            continue
+        change = r['p95_ms'] / base['p95_ms'] - 1
+        print(f"{name:20s} p95 {base['p95_ms']:8.2f} -> {r['p95_ms']:8.2f} ms ({change:+.1%})  "
+              f"throughput {base['throughput_rps']:.1f} -> {r['throughput_rps']:.1f} req/s")
+        if change > max_regression:
+            regressions.append(name)
+    return regressions
+
+def main():
+    scenarios = list(_scenarios())
+    parser = argparse.ArgumentParser(description="Load test the Bitcoin Risk Analysis API")
+    parser.add_argument('--url', help="Test a running server instead of starting one")
+    parser.add_argument('--workers', type=int, default=0, help="Start the pre-forked server with this many workers")
+    parser.add_argument('--endpoints', nargs='+', choices=scenarios, default=scenarios)
+    parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--warmup', type=int, default=20, help="Unrecorded requests per endpoint")
+    parser.add_argument('--output', default=None, help="Results file (default: output/loadtest/<time>.json)")
+    parser.add_argument('--compare', help="Baseline results file to compare against")
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help="Fail when p95 latency grows by more than this fraction of the baseline")
+    parser.add_argument('--mutating', action='store_true',
+                        help="With --url, also run the scenarios that post bars into the server's state")
+    args = parser.parse_args()
+
+    # A locally started server is thrown away afterwards; a running one is not
+    endpoints = args.endpoints
+    if args.url and not args.mutating:
+        skipped = [name for name in endpoints if name in MUTATING]
+        endpoints = [name for name in endpoints if name not in MUTATING]
+        if skipped:
+            print(f"Skipping {', '.join(skipped)} (posts bars into the server's state; use --mutating)")
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server(_free_port(), args.workers)
+    try:
+        endpoints = asyncio.run(run_load_test(url, endpoints, args.requests, args.concurrency, args.warmup))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    now = datetime.now(timezone.utc)
+    results = {
+        'timestamp': now.isoformat(),
+        'commit': _git_commit(),
+        'url': args.url or 'local',
+        'workers': args.workers,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'endpoints': endpoints,
+    }
+    output = args.output or os.path.join('output', 'loadtest', f"{now:%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print(f"Latency regression in: {', '.join(regressions)}")
+            sys.exit(1)
 
 if __name__ == "__main__":
-    test_api()
\ No newline at end of file
+    main()
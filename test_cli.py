@@ -0,0 +1,27 @@
+# test_cli.py
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import cli
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+def test_predict_scores_bars_with_naive_dates(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'output')
+    shutil.copy(os.path.join(REPO, 'output', 'btc_raw_data.csv'), tmp_path / 'output')
+    monkeypatch.chdir(tmp_path)
+    cli.main(['train'])
+
+    # New bars after the stored history, dated without an offset
+    history = pd.read_csv('output/btc_raw_data.csv', index_col='Date', parse_dates=True)
+    dates = pd.date_range(history.index[-1].tz_convert(None) + pd.Timedelta(days=1), periods=3, name='Date')
+    bars = pd.DataFrame({'Close': history['Close'].iloc[-1] * np.array([1.01, 0.98, 1.02]),
+                         'Volume': history['Volume'].iloc[-3:].to_numpy()}, index=dates)
+    bars.to_csv('bars.csv')
+
+    cli.main(['predict', '--input-data', 'bars.csv', '--output', 'predictions.csv'])
+    predictions = pd.read_csv('predictions.csv', index_col='Date', parse_dates=True)
+    assert list(predictions.index) == list(dates.tz_localize('UTC'))
+    np.testing.assert_allclose(predictions['close'], bars['Close'])
+    assert predictions['risk_level'].notna().all()
@@ -0,0 +1,68 @@
+# test_predict_risk.py
+from datetime import datetime, timedelta, timezone
+import time
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from feature_state import RollingFeatureState
+from risk_stream import BarSimulator
+
+def test_bad_close_leaves_feature_state_untouched():
+    last = RollingFeatureState.to_epoch('2025-01-01')
+    state = RollingFeatureState(np.linspace(100, 200, 200), np.full(200, 1e6), last)
+    before = state._buffer.copy()
+    for close, volume in ((0.0, 1.0), (-5.0, 1.0), (np.inf, 1.0), (np.nan, 1.0), (150.0, -1.0), (150.0, np.nan)):
+        with pytest.raises(ValueError):
+            state.update(last + 86400, close, volume)
+    np.testing.assert_array_equal(state._buffer, before)
+    assert np.isfinite(state.update(last + 86400, 150.0, 1e6)).all()
+
+def test_bad_bar_is_rejected_and_next_bar_is_served(api):
+    bar, = BarSimulator(seed=1).bars(1)
+    with TestClient(api.app) as client:
+        revision = api.feature_state.revision
+        for field, value in (('close', 0.0), ('close', -1.0), ('low', 0.0), ('volume', -1.0)):
+            response = client.post('/predict/risk', json=dict(bar, **{field: value}))
+            assert response.status_code == 422, field
+        assert api.feature_state.revision == revision
+
+        assert client.post('/predict/risk', json=bar).status_code == 200
+        loan = {'timestamp': bar['timestamp'], 'btc_price': bar['close'], 'collateral': 1.0, 'loan_amount': 30000.0}
+        assert client.post('/api/v1/predict/risk', json=loan).status_code == 200
+
+def test_bar_rejected_by_ahr999_engine_is_not_folded(api):
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    stale, = BarSimulator(start_time=today - timedelta(days=1), seed=1).bars(1)
+    bar, = BarSimulator(start_time=today, seed=1).bars(1)
+    with TestClient(api.app) as client:
+        # Another worker already moved the engine past the stale bar
+        ahr999_bar = {'symbol': 'BTC-USD', 'timestamp': bar['timestamp'], 'close': bar['close']}
+        assert client.post('/ahr999/bars', json={'bars': [ahr999_bar]}).status_code == 200
+        revision = api.feature_state.revision
+        assert client.post('/predict/risk', json=stale).status_code == 422
+        assert api.feature_state.revision == revision
+        assert client.post('/predict/risk', json=bar).status_code == 200
+
+def test_loan_book_is_scored(api):
+    book = 'loan_id,collateral,loan_amount\na,1.0,30000\nb,2.0,150000\n'
+    with TestClient(api.app) as client:
+        response = client.post('/api/v1/predict/risk/bulk?btc_price=90000', content=book,
+                               headers={'Content-Type': 'text/csv'})
+        assert response.status_code == 200
+        assert response.json()['columns']['loan_id'] == ['a', 'b']
+        response = client.post('/api/v1/predict/risk/bulk', content='not,a\nbook,', headers={'Content-Type': 'text/csv'})
+        assert response.status_code == 422
+
+def test_incremental_retrain_uses_ingested_bars(api):
+    with TestClient(api.app) as client:
+        for bar in BarSimulator(seed=3).bars(3):
+            assert client.post('/predict/risk', json=bar).status_code == 200
+        job = client.post('/model/retrain?incremental=true').json()
+        deadline = time.time() + 120
+        while job['status'] == 'running':
+            assert time.time() < deadline, "Retrain job did not finish"
+            time.sleep(0.2)
+            job = client.get(f"/model/retrain/{job['job_id']}").json()
+    assert job['status'] == 'completed', job.get('error')
+    assert job['result']['mode'] != 'none'
+    assert api.model.data.index[-1].timestamp() == api.feature_state.last_timestamp
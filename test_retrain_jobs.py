@@ -0,0 +1,117 @@
+# test_retrain_jobs.py
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import httpx
+import pytest
+from job_registry import JobRegistry
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+def _job(job_id):
+    return {'job_id': job_id, 'incremental': False, 'stage': 'queued', 'progress': 0.0,
+            'started_at': time.time()}
+
+def _in_child(func):
+    """Run func in a forked process; returns its exit code (0 when func returns True)"""
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = 0 if func() else 1
+        finally:
+            os._exit(code)
+    return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+def test_running_job_blocks_other_processes():
+    registry = JobRegistry().share()
+    assert registry.start(_job('first')) is None
+
+    def other_worker():
+        blocked = registry.start(_job('second'))
+        registry.update('first', stage='training', progress=0.5)
+        return blocked is not None and blocked['job_id'] == 'first'
+
+    assert _in_child(other_worker) == 0
+    assert [job['job_id'] for job in registry.list()] == ['first']
+    assert registry.get('first')['progress'] == 0.5
+
+def test_job_of_exited_worker_is_failed():
+    registry = JobRegistry().share()
+    assert _in_child(lambda: registry.start(_job('orphan')) is None) == 0
+    assert registry.start(_job('next')) is None
+    assert registry.get('orphan')['status'] == 'failed'
+    assert registry.get('next')['status'] == 'running'
+
+def test_only_recent_jobs_are_kept():
+    registry = JobRegistry(max_jobs=3).share()
+    for i in range(5):
+        registry.start(_job(f'job{i}'))
+        registry.update(f'job{i}', status='completed')
+    assert [job['job_id'] for job in registry.list()] == ['job4', 'job3', 'job2']
+
+def _get(url, **kwargs):
+    """GET on a fresh connection (so requests spread over the workers), retried while workers restart"""
+    for _ in range(50):
+        try:
+            return httpx.get(url, **kwargs)
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"No response from {url}")
+
+@pytest.fixture
+def server(tmp_path):
+    """Two-worker pre-forked server in a scratch copy of the repo (trains the models on start)"""
+    for name in os.listdir(REPO):
+        if name.endswith('.py'):
+            shutil.copy(os.path.join(REPO, name), tmp_path)
+    os.makedirs(tmp_path / 'output')
+    shutil.copy(os.path.join(REPO, 'output', 'btc_raw_data.csv'), tmp_path / 'output')
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, 'api_service.py', '--workers', '2', '--host', '127.0.0.1',
+                                '--port', str(port)], cwd=tmp_path)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 300
+    while True:
+        assert process.poll() is None, "API server exited"
+        assert time.time() < deadline, "API server did not become ready"
+        try:
+            if httpx.get(f"{url}/health/ready").status_code == 200:
+                break
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    yield url
+    process.terminate()
+    process.wait(timeout=60)
+
+def test_retrain_jobs_are_shared_between_workers(server):
+    response = httpx.post(f"{server}/model/retrain")
+    assert response.status_code == 202
+    job_id = response.json()['job_id']
+
+    # Every worker sees the job and refuses to start a second one
+    for _ in range(10):
+        assert httpx.post(f"{server}/model/retrain").status_code == 409
+        listed = _get(f"{server}/model/retrain").json()['jobs']
+        assert [job['job_id'] for job in listed] == [job_id]
+
+    # The supervisor reloads the models and replaces all workers; no worker
+    # serves the old version once one serves the new one
+    served = []
+    deadline = time.time() + 300
+    while served[-10:] != [2] * 10:
+        assert time.time() < deadline, "Workers did not switch to the retrained models"
+        served.append(_get(f"{server}/health/ready").json()['model_version'])
+        time.sleep(0.05)
+    assert served == sorted(served)
+
+    job = _get(f"{server}/model/retrain/{job_id}").json()
+    assert job['status'] == 'completed'
+    assert job['model_version'] == 2
@@ -0,0 +1,78 @@
+# test_risk_stream.py
+import asyncio
+import json
+import httpx
+import pytest
+from risk_stream import BarSimulator, StreamSubscriber
+
+def test_full_subscriber_drops_oldest_update():
+    async def run():
+        subscriber = StreamSubscriber(queue_size=3)
+        for i in range(5):
+            subscriber.offer(i)
+        return subscriber.dropped, [await subscriber.get() for _ in range(3)]
+
+    assert asyncio.run(run()) == (2, [2, 3, 4])
+
+class _Stream:
+    """An open GET /stream/risk request on the ASGI app"""
+
+    def __init__(self, app):
+        self.events = asyncio.Queue()
+        self._closed = asyncio.Event()
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': '/stream/risk', 'raw_path': b'/stream/risk', 'query_string': b'',
+            'root_path': '', 'headers': [(b'host', b'test')], 'client': ('test', 1), 'server': ('test', 80),
+        }
+        self._task = asyncio.create_task(app(scope, self._receive, self._send))
+
+    async def _receive(self):
+        await self._closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def _send(self, message):
+        if message['type'] == 'http.response.body':
+            for line in message.get('body', b'').decode().splitlines():
+                if line.startswith('data: '):
+                    await self.events.put(json.loads(line[len('data: '):]))
+
+    async def next_update(self):
+        return await asyncio.wait_for(self.events.get(), timeout=10)
+
+    async def close(self):
+        self._closed.set()
+        await asyncio.wait_for(self._task, timeout=10)
+
+def test_stream_fans_out_simulated_bars(api):
+    async def run():
+        async with api.app.router.lifespan_context(api.app):
+            streams = [_Stream(api.app) for _ in range(3)]
+            # Every subscriber starts with the latest bar of the loaded history
+            for stream in streams:
+                await stream.next_update()
+
+            # A client that stops reading; its queue holds the 4 newest updates
+            stalled = api.risk_stream.subscribe()
+
+            transport = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                bars = list(BarSimulator(seed=0).bars(6))
+                for bar in bars:
+                    response = await client.post('/predict/risk', json=bar)
+                    assert response.status_code == 200
+                    for stream in streams:
+                        update = await stream.next_update()
+                        assert update['timestamp'] == bar['timestamp']
+                        assert update['close'] == pytest.approx(bar['close'])
+                        assert update['risk_level'] == response.json()['risk_level']
+
+            queued = [json.loads(stalled.queue.get_nowait().split('data: ')[1]) for _ in range(4)]
+            for stream in streams:
+                await stream.close()
+            return stalled.dropped, [update['timestamp'] for update in queued], [b['timestamp'] for b in bars]
+
+    dropped, queued, posted = asyncio.run(run())
+    # The latest history bar and the first 6 - 4 = 2 bars were dropped
+    assert dropped == 3
+    assert queued == posted[-4:]